@@ -0,0 +1,100 @@
+"""Compare HTML parser backends on saved search result pages
+
+    python benchmarks/parse_benchmark.py [--repeat 50] [fixture.html ...]
+
+Each backend parses every fixture page; the script reports the median parse
+time per page and checks that all backends extract the same listings. The
+'json' column is the embedded-results extraction that skips the DOM.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import parsers  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', '*.html')
+
+
+class LegacyParser:
+    """The original scrape_immoweb extraction: full soup tree, per-listing get_text()"""
+
+    def parse(self, content):
+        soup = BeautifulSoup(content, 'html.parser')
+        listings = soup.find_all('article') or soup.find_all('div', class_=lambda x: x and 'card' in x.lower())
+        result = []
+        for listing in listings:
+            title_elem = listing.find('h2') or listing.find('h3') or listing.find('a')
+            price_elem = listing.find(string=lambda t: t and '€' in str(t))
+            link_elem = listing.find('a', href=True)
+            if not link_elem:
+                continue
+            result.append(parsers.make_listing(
+                link_elem['href'],
+                title_elem.get_text(strip=True) if title_elem else None,
+                price_elem.strip() if price_elem else None,
+                'particulier' in listing.get_text().lower()))
+        return result
+
+
+def key_fields(listings):
+    """Fields every extraction mode must agree on (titles and price text differ by design)"""
+    if listings is None:
+        return None
+    return [(item['url'], item['price_value'], item['seller_type']) for item in listings]
+
+
+def time_parser(parser, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser.parse(content)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--repeat', type=int, default=50)
+    ap.add_argument('fixtures', nargs='*')
+    args = ap.parse_args(argv)
+
+    paths = args.fixtures or sorted(glob.glob(FIXTURES))
+    if not paths:
+        ap.error('no fixture pages found')
+
+    backends = ['legacy'] + sorted(parsers.PARSERS)
+    instances = {name: parsers.get_parser(name) for name in parsers.PARSERS}
+    instances['legacy'] = LegacyParser()
+    instances['json'] = parsers.EmbeddedJsonParser()
+    backends.append('json')
+    print(f"{'fixture':40} " + ' '.join(f'{name + " ms":>10}' for name in backends) + f" {'listings':>9}")
+    totals = {name: 0.0 for name in backends}
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        results = {name: key_fields(instances[name].parse(content)) for name in backends}
+        reference = results[backends[0]]
+        for name, listings in results.items():
+            if name == 'json' and listings is None:
+                continue
+            if listings != reference:
+                print(f"WARNING: {name} extracted different listings for {os.path.basename(path)}")
+        timings = {name: time_parser(instances[name], content, args.repeat) for name in backends}
+        for name, value in timings.items():
+            totals[name] += value
+        print(f"{os.path.basename(path)[:40]:40} " + ' '.join(f'{timings[name] * 1000:10.2f}' for name in backends)
+              + f" {len(reference):9d}")
+
+    for name in backends[1:]:
+        print(f"{name}: {totals['legacy'] / totals[name]:.1f}x faster than the legacy full-tree parse")
+
+
+if __name__ == '__main__':
+    main()
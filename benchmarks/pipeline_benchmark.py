@@ -0,0 +1,200 @@
+"""End-to-end benchmark of the check cycle against the offline replay server
+
+    python benchmarks/pipeline_benchmark.py [--searches 1 50 500] [--latency 0.02] [--output results.json]
+    python benchmarks/pipeline_benchmark.py --baseline old.json
+
+For every search count a fresh database is seeded with that many saved
+searches and check_for_new_properties runs twice: 'cold' (everything is new)
+and 'warm' (nothing changed, pages come back 304). Each run happens in its
+own subprocess so caches start empty. The JSON written to --output (or
+stdout) holds wall time and per-stage time (fetch, parse, dedup, insert,
+history, notify) per cycle and per search, and can be passed back as
+--baseline on a later commit to print the differences.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay_server  # noqa: E402
+
+STAGES = ['fetch', 'parse', 'dedup', 'insert', 'history', 'notify']
+PROVINCES = ['antwerp', 'flemish-brabant', 'walloon-brabant', 'west-flanders', 'east-flanders', 'hainaut',
+             'liege', 'limburg', 'luxembourg', 'namur']
+PROPERTY_TYPES = ['house', 'apartment', 'land', 'office']
+
+
+def seed_searches(db, count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for number in range(count):
+        min_price = rng.choice([0, 100000, 200000, 300000])
+        rows.append((f"search {number}", rng.choice(PROVINCES), rng.choice(PROPERTY_TYPES), min_price,
+                     min_price + rng.choice([150000, 250000, 500000]), 'private' if rng.random() < 0.2 else 'all'))
+    with db.transaction() as conn:
+        conn.executemany("""INSERT INTO search_configs
+                            (name, province, property_type, min_price, max_price, seller_type, active)
+                            VALUES (?, ?, ?, ?, ?, ?, 1)""", rows)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def child(count, seed, result_file):
+    """Run the cycles in this process; the environment already points at the replay server"""
+    quiet = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(quiet):
+        import main
+        import db
+        import http_client
+        import metrics
+        import notifications
+        import runs
+        main.scheduler.shutdown(wait=False)
+        for notifier in main.notifiers:
+            notifier.stop()
+        # Drained synchronously below so notify time is measured per cycle
+        workers = [notifications.NotificationWorker(sink) for sink in main.NOTIFICATION_SINKS]
+        seed_searches(db, count, seed)
+
+    results = []
+    for cycle in ('cold', 'warm'):
+        metrics.reset()
+        http_client.reset_stats()
+        with contextlib.redirect_stdout(quiet):
+            started = time.perf_counter()
+            new_count = main.check_for_new_properties()
+            check_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            for worker in workers:
+                worker.drain()
+            notify_seconds = time.perf_counter() - started
+        run_id = db.query_one("SELECT MAX(id) FROM check_runs")[0]
+        per_search = [search['seconds'] for search in runs.run_status(run_id)['searches']
+                      if search['seconds'] is not None]
+        spans = metrics.snapshot()
+        http = http_client.stats()
+        results.append({
+            'searches': count,
+            'cycle': cycle,
+            'wall_seconds': round(check_seconds + notify_seconds, 4),
+            'check_seconds': round(check_seconds, 4),
+            'notify_seconds': round(notify_seconds, 4),
+            'new_properties': new_count,
+            'requests': http['requests'],
+            'not_modified': http['hits'],
+            'per_search_seconds': {'p50': percentile(per_search, 0.5), 'p95': percentile(per_search, 0.95),
+                                   'max': max(per_search, default=None)},
+            'stages': {name: {'count': spans.get(name, {}).get('count', 0),
+                              'seconds': round(spans.get(name, {}).get('seconds', 0.0), 4),
+                              'ms_per_search': round(spans.get(name, {}).get('seconds', 0.0) * 1000 / count, 3)}
+                       for name in STAGES},
+        })
+    with open(result_file, 'w') as f:
+        json.dump(results, f)
+
+
+def run_child(count, server, args):
+    workdir = tempfile.mkdtemp(prefix='immoweb-bench-')
+    result_file = os.path.join(workdir, 'result.json')
+    env = dict(os.environ,
+               DATABASE_NAME=os.path.join(workdir, 'bench.db'),
+               IMMOWEB_BASE_URL=server.url,
+               WEBHOOK_URL=f"{server.url}/hook",
+               NTFY_URL='',
+               SCRAPE_DELAY='0')
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(count), '--seed', str(args.seed),
+                    '--result-file', result_file], env=env, cwd=workdir, check=True)
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None, out=sys.stderr):
+    previous = {(row['searches'], row['cycle']): row for row in (baseline or {}).get('results', [])}
+    print(f"{'searches':>8} {'cycle':>5} {'wall s':>8} " + ' '.join(f'{name + " ms/s":>13}' for name in STAGES)
+          + f" {'new':>6} {'req':>5}", file=out)
+    for row in results:
+        line = (f"{row['searches']:8d} {row['cycle']:>5} {row['wall_seconds']:8.2f} "
+                + ' '.join(f"{row['stages'][name]['ms_per_search']:13.2f}" for name in STAGES)
+                + f" {row['new_properties'] or 0:6d} {row['requests']:5d}")
+        old = previous.get((row['searches'], row['cycle']))
+        if old and old['wall_seconds']:
+            line += f"  ({row['wall_seconds'] / old['wall_seconds']:.2f}x baseline wall time)"
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--searches', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child, args.seed, args.result_file)
+        return
+
+    server = replay_server.start(pages=args.pages, latency=args.latency, jitter=args.jitter,
+                                 error_rate=args.error_rate, seed=args.seed)
+    results = []
+    for count in args.searches:
+        print(f"Running {count} searches against {server.url}", file=sys.stderr)
+        results.extend(run_child(count, server, args))
+    server.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    document = {
+        'benchmark': 'pipeline',
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'options': {'pages': args.pages, 'latency': args.latency, 'jitter': args.jitter,
+                    'error_rate': args.error_rate, 'seed': args.seed},
+        'server': server.stats,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
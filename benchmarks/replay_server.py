@@ -0,0 +1,158 @@
+"""Local stand-in for Immoweb that replays recorded search result pages
+
+    python benchmarks/replay_server.py [--port 8765] [--latency 0.05] [--error-rate 0.01]
+
+Point the app at it with IMMOWEB_BASE_URL=http://127.0.0.1:8765 (and
+SCRAPE_DELAY=0). Every /en/search/... URL is answered with a fixture page
+whose listing IDs are rewritten per search path and page, so different
+searches see different listings. Pages beyond --pages come back empty.
+Responses carry an ETag and honour If-None-Match. POSTs (e.g. a WEBHOOK_URL
+pointing here) are accepted and discarded.
+"""
+import argparse
+import glob
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', '*.html')
+# Immoweb classified IDs are 8 digits starting with 1; prices never are
+LISTING_ID_RE = re.compile(rb'\b1\d{7}\b')
+EMPTY_PAGE = b"<html><body><iw-search :results='[]'></iw-search></body></html>"
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixtures, pages=4, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(address, ReplayHandler)
+        self.fixtures = fixtures
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'errors': 0, 'posts': 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def delay(self):
+        with self.lock:
+            fail = self.random.random() < self.error_rate
+            wait = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if wait:
+            time.sleep(wait)
+        return fail
+
+    def page(self, path, page):
+        """Fixture page with listing IDs made unique for this search path and page"""
+        if page > self.pages:
+            return EMPTY_PAGE
+        key = zlib.crc32(path.encode())
+        fixture = self.fixtures[(key + page) % len(self.fixtures)]
+        prefix = b'%d' % ((key % 100000) * 100 + page)
+        return LISTING_ID_RE.sub(lambda match: prefix + match.group(0), fixture)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        fail = server.delay()
+        if fail:
+            server.count('errors')
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        parts = urlsplit(self.path)
+        if not parts.path.startswith('/en/search/'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        query = parse_qs(parts.query)
+        page = int(query.get('page', ['1'])[0])
+        search = parts.path + '?' + '&'.join(f"{k}={v[0]}" for k, v in sorted(query.items()) if k != 'page')
+        body = server.page(search, page)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            server.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.count('posts')
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_fixtures(paths=None):
+    paths = paths or sorted(glob.glob(FIXTURES))
+    fixtures = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            fixtures.append(f.read())
+    if not fixtures:
+        raise SystemExit('no fixture pages found')
+    return fixtures
+
+
+def start(port=0, **options):
+    """Start a replay server on a background thread and return it"""
+    server = ReplayServer(('127.0.0.1', port), load_fixtures(options.pop('fixtures', None)), **options)
+    threading.Thread(target=server.serve_forever, name='replay-server', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=4, help='result pages per search before an empty page')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds of random latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('fixtures', nargs='*')
+    args = parser.parse_args(argv)
+
+    server = ReplayServer(('127.0.0.1', args.port), load_fixtures(args.fixtures), pages=args.pages,
+                          latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    print(f"Replaying {len(server.fixtures)} fixture pages on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,9 @@ class Config:
     
     # Database
     DATABASE_NAME = os.environ.get('DATABASE_NAME') or 'immoweb_data.db'
+    DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', '5000'))  # milliseconds
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))  # idle connections kept open
     
     # Email Settings
     EMAIL_ENABLED = os.environ.get('EMAIL_ENABLED', '0') == '1'
@@ -21,15 +24,67 @@ class Config:
     EMAIL_TO = os.environ.get('EMAIL_TO', '')
     SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
     SMTP_PORT = int(os.environ.get('SMTP_PORT', '465'))
+    SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', '30'))  # seconds
+    SMTP_IDLE_TIMEOUT = int(os.environ.get('SMTP_IDLE_TIMEOUT', '120'))  # close the connection after this idle time
+    
+    # Notification outbox
+    NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', '50'))  # properties per digest
+    NOTIFY_POLL_INTERVAL = int(os.environ.get('NOTIFY_POLL_INTERVAL', '30'))  # seconds
+    NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', '8'))
+    NOTIFY_RETRY_BASE = int(os.environ.get('NOTIFY_RETRY_BASE', '60'))  # seconds, doubled per failed attempt
+    OUTBOX_KEEP_DAYS = int(os.environ.get('OUTBOX_KEEP_DAYS', '30'))  # finished outbox rows are deleted after this
+    
+    # Extra notification sinks (enabled by setting their URL)
+    WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+    WEBHOOK_STYLE = os.environ.get('WEBHOOK_STYLE', 'json')  # json or slack
+    NTFY_URL = os.environ.get('NTFY_URL', '')  # e.g. https://ntfy.sh/<topic>
+    NTFY_TOKEN = os.environ.get('NTFY_TOKEN', '')
+    SINK_TIMEOUT = int(os.environ.get('SINK_TIMEOUT', '5'))  # seconds per delivery
+    SINK_FAILURE_THRESHOLD = int(os.environ.get('SINK_FAILURE_THRESHOLD', '5'))  # failures before the circuit opens
+    SINK_COOLDOWN = int(os.environ.get('SINK_COOLDOWN', '300'))  # seconds before an open circuit is retried
     
     # Scraping Settings
+    IMMOWEB_BASE_URL = os.environ.get('IMMOWEB_BASE_URL', 'https://www.immoweb.be')  # point at a replay server offline
     CHECK_INTERVAL = int(os.environ.get('CHECK_INTERVAL', '60'))
     MAX_RESULTS_PER_SEARCH = int(os.environ.get('MAX_RESULTS_PER_SEARCH', '20'))
+    MAX_PAGES_PER_SEARCH = int(os.environ.get('MAX_PAGES_PER_SEARCH', '5'))
     REQUEST_TIMEOUT = int(os.environ.get('REQUEST_TIMEOUT', '10'))
+    HTML_PARSER = os.environ.get('HTML_PARSER', 'auto')  # auto, lxml or bs4
+    EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'auto')  # auto, json or dom
+    
+    # Adaptive scheduling (minutes)
+    MIN_POLL_INTERVAL = int(os.environ.get('MIN_POLL_INTERVAL', '5'))
+    MAX_POLL_INTERVAL = int(os.environ.get('MAX_POLL_INTERVAL', '360'))
+    VELOCITY_SMOOTHING = float(os.environ.get('VELOCITY_SMOOTHING', '0.3'))
+    SCHEDULER_TICK = int(os.environ.get('SCHEDULER_TICK', '60'))  # seconds
+    RUN_LEASE_TTL = int(os.environ.get('RUN_LEASE_TTL', '900'))  # seconds without progress before a run counts as dead
+    RUN_KEEP_DAYS = int(os.environ.get('RUN_KEEP_DAYS', '30'))  # finished runs and their searches are deleted after this
+    HISTORY_RECRAWL_HOURS = int(os.environ.get('HISTORY_RECRAWL_HOURS', '24'))  # full passes for price changes; 0 = off
+    
+    # Seen-property index
+    SEEN_INDEX_CAPACITY = int(os.environ.get('SEEN_INDEX_CAPACITY', '100000'))
+    SEEN_INDEX_ERROR_RATE = float(os.environ.get('SEEN_INDEX_ERROR_RATE', '0.001'))
     
     # Rate Limiting
     SCRAPE_DELAY = int(os.environ.get('SCRAPE_DELAY', '2'))
     
+    # Logging
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    
+    # Web
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '300'))  # seconds; covers writes by other processes
+    EVENT_STREAM_MAX = int(os.environ.get('EVENT_STREAM_MAX', '300'))  # seconds before an event stream is closed
+    
+    # Profiling
+    PROFILE_RUNS = int(os.environ.get('PROFILE_RUNS', '0'))  # check runs to profile after startup
+    PROFILE_INTERVAL = int(os.environ.get('PROFILE_INTERVAL', '10'))  # milliseconds between stack samples
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '20'))  # stored profiles
+    
+    # Concurrency
+    MAX_CONCURRENT_SEARCHES = int(os.environ.get('MAX_CONCURRENT_SEARCHES', '4'))
+    MAX_CONNECTIONS_PER_HOST = int(os.environ.get('MAX_CONNECTIONS_PER_HOST', '2'))
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+    
     @staticmethod
     def init_app(app):
         """Initialize application with configuration"""
@@ -0,0 +1,113 @@
+"""SQLite access shared by the web app, the scheduler and the workers
+
+A thread borrows a connection from a per-database pool on first use and
+keeps it until release_connection(), which the app calls on request
+teardown and the check workers call when a fetch group is done. At most
+DB_POOL_SIZE idle connections are kept open; the PRAGMAs run once per
+connection rather than once per thread.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import Config
+
+_local = threading.local()
+_database = Config.DATABASE_NAME
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def configure(database):
+    """Point the data-access layer at a database file"""
+    global _database
+    _database = database
+
+
+def _connect():
+    conn = sqlite3.connect(_database, timeout=Config.DB_BUSY_TIMEOUT / 1000,
+                           isolation_level=None, check_same_thread=False,
+                           cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    # WAL lets dashboard readers proceed while the scheduler is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={Config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT)}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def _pool(database):
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = queue.Queue(maxsize=max(1, Config.DB_POOL_SIZE))
+        return pool
+
+
+def get_connection():
+    """Return this thread's connection, taking one from the pool on first use"""
+    conns = getattr(_local, 'connections', None)
+    if conns is None:
+        conns = _local.connections = {}
+    conn = conns.get(_database)
+    if conn is None:
+        try:
+            conn = _pool(_database).get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        conns[_database] = conn
+    return conn
+
+
+def release_connection(exception=None):
+    """Hand this thread's connections back to their pools (closing them when a pool is full)"""
+    conns = getattr(_local, 'connections', None) or {}
+    while conns:
+        database, conn = conns.popitem()
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool(database).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def query(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def query_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def counter(name):
+    """Value of a trigger-maintained counter (0 when it does not exist)"""
+    row = query_one("SELECT value FROM counters WHERE name = ?", (name,))
+    return row[0] if row else 0
+
+
+def execute(sql, params=()):
+    """Run a single write statement in its own transaction"""
+    with transaction() as conn:
+        return conn.execute(sql, params)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """Run a block inside BEGIN/COMMIT, rolling back on error
+
+    Nested use joins the outer transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,209 @@
+"""Streaming export of the properties table
+
+Rows are read from a server-side SQLite cursor in batches and written out as
+they arrive, so memory stays flat regardless of table size. Incremental
+exports are keyed on the insert sequence (properties.seq): every export
+reports the last sequence it covers, and passing it back as --after (?after=
+on /export) returns only rows inserted since.
+
+    python export.py --format ndjson --since 2024-01-01 > properties.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import db
+import migrations
+from config import Config
+
+COLUMNS = ['id', 'url', 'title', 'price', 'price_value', 'location', 'seller_type', 'first_seen', 'notified',
+           'listing_id', 'postal_code', 'bedrooms', 'surface']
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+BATCH_SIZE = 1000
+
+
+def parse_watermark(value):
+    """Accept unix seconds or a local 'YYYY-MM-DD[ HH:MM:SS]' timestamp"""
+    if value in (None, ''):
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid watermark: {value}")
+
+
+def parse_sequence(value):
+    if value in (None, ''):
+        return None
+    value = str(value).strip()
+    if not value.isdigit():
+        raise ValueError(f"Invalid sequence watermark: {value}")
+    return int(value)
+
+
+def export_window(after=None):
+    """Return (after, until) sequence bounds for an export
+
+    until is the sequence of the newest committed row when the export starts.
+    Sequence numbers are assigned inside the inserting transaction, so a row
+    committed later always gets a higher one and 'after=<previous until>'
+    never skips or repeats a row.
+    """
+    row = db.query_one("SELECT value FROM counters WHERE name = 'properties_seq'")
+    until = row[0] if row else 0
+    if after is not None:
+        until = max(until, after)
+    return after, until
+
+
+def iter_batches(after, until, since=None):
+    sql = "SELECT " + ", ".join(COLUMNS) + " FROM properties WHERE seq <= ?"
+    params = [until]
+    if after is not None:
+        sql += " AND seq > ?"
+        params.append(after)
+    if since is not None:
+        sql += " AND first_seen > ?"
+        params.append(since)
+    sql += " ORDER BY seq"
+    c = db.get_connection().execute(sql, params)
+    try:
+        while True:
+            rows = c.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        c.close()
+
+
+def stream_csv(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def stream_ndjson(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+    return pyarrow, pyarrow.parquet
+
+
+def stream_parquet(batches, pa, pq):
+    schema = pa.schema([
+        ('id', pa.string()), ('url', pa.string()), ('title', pa.string()), ('price', pa.string()),
+        ('price_value', pa.int64()), ('location', pa.string()), ('seller_type', pa.string()),
+        ('first_seen', pa.int64()), ('notified', pa.int64()), ('listing_id', pa.int64()),
+        ('postal_code', pa.string()), ('bedrooms', pa.int64()), ('surface', pa.int64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            # One row group per batch keeps only BATCH_SIZE rows in memory
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream(fmt, after=None, until=None, since=None):
+    """Yield the export as str (csv/ndjson) or bytes (parquet) chunks"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    # Resolve the optional dependency before any output is produced
+    modules = _pyarrow() if fmt == 'parquet' else None
+    if until is None:
+        after, until = export_window(after)
+    batches = iter_batches(after, until, since)
+    if fmt == 'csv':
+        return stream_csv(batches)
+    if fmt == 'ndjson':
+        return stream_ndjson(batches)
+    return stream_parquet(batches, *modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export found properties')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--since', help='only rows first seen after this time (unix seconds or YYYY-MM-DD)')
+    parser.add_argument('--after', help='only rows inserted after this watermark of a previous export')
+    parser.add_argument('--output', help='output file (default: stdout)')
+    parser.add_argument('--database', default=Config.DATABASE_NAME)
+    args = parser.parse_args(argv)
+
+    db.configure(args.database)
+    migrations.migrate()
+    since = parse_watermark(args.since)
+    after, until = export_window(parse_sequence(args.after))
+    binary = args.format == 'parquet'
+    if args.output:
+        out = open(args.output, 'wb' if binary else 'w', newline='' if not binary else None)
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        for chunk in stream(args.format, after, until, since):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    # Pass this as --after on the next run to export only newer rows
+    print(f"Watermark: {until}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
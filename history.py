@@ -0,0 +1,129 @@
+"""Price history for listings we have already stored
+
+Every sighting of a known listing is reduced to a 64-bit content hash of the
+fields we track. The hash is compared against an in-memory copy of the last
+stored version, so an unchanged listing costs no database write. Only a
+changed hash adds a row to property_snapshots (with the price delta) and
+updates the property; price drops are queued in the notification outbox.
+"""
+import hashlib
+import threading
+import time
+
+import db
+import metrics
+import notifications
+import view_cache
+
+# Fields that define a listing version; titles and price texts differ between extraction modes
+TRACKED_FIELDS = ('price_value', 'seller_type')
+CACHE_LIMIT = 200000
+# Cached for listings that are not stored (e.g. filtered out by seller type), so they are not looked up again
+MISSING = object()
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def property_id(listing):
+    """Stable ID of a listing; the classified number, as URLs differ between extraction modes"""
+    key = f"immoweb:{listing['listing_id']}" if listing.get('listing_id') else listing['url']
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def content_hash(listing):
+    """Signed 64-bit hash of the tracked fields, so it fits an SQLite INTEGER"""
+    key = '\x1f'.join('' if listing.get(field) is None else str(listing[field]) for field in TRACKED_FIELDS)
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def remember(property_id, content_hash):
+    with _cache_lock:
+        if len(_cache) >= CACHE_LIMIT:
+            _cache.clear()
+        _cache[property_id] = content_hash
+
+
+def snapshot_new(conn, rows):
+    """Record version 1 of newly inserted properties; rows carry id, content_hash and price_value"""
+    conn.executemany("""INSERT OR IGNORE INTO property_snapshots
+                        (property_id, version, content_hash, price_value, price_delta, seen_at)
+                        VALUES (:id, 1, :content_hash, :price_value, NULL, :first_seen)""", rows)
+    for row in rows:
+        remember(row['id'], row['content_hash'])
+
+
+def _stored_hashes(ids):
+    """Last stored hash for ids missing from the cache; ids not in the properties table are left out"""
+    found = {}
+    ids = list(ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = db.query(f"SELECT id, content_hash FROM properties WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        for row in rows:
+            found[row['id']] = row['content_hash']
+        for pid in chunk:
+            remember(pid, found.get(pid, MISSING))
+    return found
+
+
+def track(listings, channels):
+    """
+    Compare a result page against the stored versions
+
+    Only listings on pages that were actually fetched are compared; the
+    scraper stops early on known listings and 304s, and reads every page
+    only on its periodic recrawl (HISTORY_RECRAWL_HOURS). Returns the price
+    drops as (property id, title, old price, new price).
+    """
+    hashes = {}
+    for listing in listings:
+        hashes.setdefault(property_id(listing), (content_hash(listing), listing))
+
+    with _cache_lock:
+        cached = {pid: _cache[pid] for pid in hashes if pid in _cache}
+    stored = {pid: value for pid, value in cached.items() if value is not MISSING}
+    stored.update(_stored_hashes(pid for pid in hashes if pid not in cached))
+    changed = {pid: hashes[pid] for pid, stored_hash in stored.items() if stored_hash != hashes[pid][0]}
+    if not changed:
+        return []
+
+    drops = []
+    now = int(time.time())
+    with db.transaction(immediate=True) as conn:
+        ids = list(changed)
+        rows = conn.execute(f"""SELECT p.id, p.title, p.price_value, p.content_hash,
+                                       (SELECT MAX(version) FROM property_snapshots s WHERE s.property_id = p.id)
+                                       AS version
+                                FROM properties p WHERE p.id IN ({','.join('?' * len(ids))})""", ids).fetchall()
+        snapshots, updates, alerts = [], [], []
+        for row in rows:
+            new_hash, listing = changed[row['id']]
+            # Re-checked under the write lock; another thread may have recorded this version already
+            if row['content_hash'] == new_hash:
+                continue
+            old_price, new_price = row['price_value'], listing['price_value']
+            delta = new_price - old_price if old_price is not None and new_price is not None else None
+            version = (row['version'] or 0) + 1
+            if row['content_hash'] is None:
+                # First sighting since history was introduced: this is the baseline, not a change
+                delta = None
+            snapshots.append((row['id'], version, new_hash, new_price, delta, now))
+            updates.append((listing['price'], new_price, listing['seller_type'], new_hash, row['id']))
+            if delta is not None and delta < 0:
+                alerts.append((row['id'], version))
+                drops.append((row['id'], row['title'], old_price, new_price))
+        conn.executemany("""INSERT INTO property_snapshots
+                            (property_id, version, content_hash, price_value, price_delta, seen_at)
+                            VALUES (?, ?, ?, ?, ?, ?)""", snapshots)
+        conn.executemany("""UPDATE properties SET price = ?, price_value = ?, seller_type = ?, content_hash = ?
+                            WHERE id = ?""", updates)
+        notifications.enqueue(conn, alerts, channels, event='price_drop')
+
+    for pid, (new_hash, _) in changed.items():
+        remember(pid, new_hash)
+    view_cache.invalidate()
+    if drops:
+        metrics.inc('immoweb_price_drops_total', len(drops))
+    return drops
+
@@ -0,0 +1,173 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+try:
+    import brotli  # noqa: F401  (urllib3 decodes 'br' when available)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """Per-host concurrency limit combined with a per-host token bucket"""
+
+    def __init__(self, max_connections, delay):
+        self.max_connections = max(1, max_connections)
+        # Each connection slot may issue one request per SCRAPE_DELAY seconds
+        self.rate = self.max_connections / delay if delay > 0 else 0
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def _get(self, host):
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (threading.BoundedSemaphore(self.max_connections),
+                                    TokenBucket(self.rate, self.max_connections))
+            return self.hosts[host]
+
+    def request(self, method, url, **kwargs):
+        semaphore, bucket = self._get(urlsplit(url).netloc)
+        with semaphore:
+            bucket.acquire()
+            return session.request(method, url, **kwargs)
+
+
+class ValidatorCache:
+    """Remembers ETag/Last-Modified per URL and counts conditional hits"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.validators = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'requests': 0,
+            'hits': 0,
+            'misses': 0,
+            'bytes_received': 0,
+            'bytes_saved': 0,
+            'seconds': 0.0,
+        }
+
+    def headers_for(self, url):
+        with self.lock:
+            entry = self.validators.get(url)
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, url, response):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['seconds'] += response.elapsed.total_seconds()
+            if response.status_code == 304:
+                self.stats['hits'] += 1
+                entry = self.validators.get(url)
+                if entry:
+                    self.stats['bytes_saved'] += entry['size']
+                return
+            self.stats['misses'] += 1
+            size = wire_size(response)
+            self.stats['bytes_received'] += size
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status_code == 200 and (etag or last_modified):
+                self.validators[url] = {'etag': etag, 'last_modified': last_modified, 'size': size}
+            else:
+                self.validators.pop(url, None)
+
+
+def wire_size(response):
+    """Bytes read from the socket for the body, before gzip/br decoding"""
+    response.content  # make sure the body has been read
+    try:
+        return response.raw.tell()
+    except (AttributeError, ValueError):
+        return int(response.headers.get('Content-Length') or len(response.content))
+
+
+def _build_session():
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_SIZE, pool_maxsize=Config.HTTP_POOL_SIZE)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return s
+
+
+session = _build_session()
+limiter = HostLimiter(Config.MAX_CONNECTIONS_PER_HOST, Config.SCRAPE_DELAY)
+validators = ValidatorCache()
+
+
+def get(url, conditional=False, refresh=False, **kwargs):
+    """Rate limited GET over the shared session
+
+    With conditional=True the stored ETag/Last-Modified for this URL are sent,
+    so an unchanged page comes back as 304 Not Modified. refresh=True skips
+    sending them for this request but still records the response.
+    """
+    kwargs.setdefault('timeout', Config.REQUEST_TIMEOUT)
+    if conditional and not refresh:
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(validators.headers_for(url))
+        kwargs['headers'] = headers
+    response = limiter.request('GET', url, **kwargs)
+    if conditional:
+        validators.record(url, response)
+    return response
+
+
+def forget(urls):
+    """Drop stored validators, so the next conditional GET of these URLs fetches the page again"""
+    with validators.lock:
+        for url in urls:
+            validators.validators.pop(url, None)
+
+
+def stats():
+    """Conditional request counters since the last reset"""
+    with validators.lock:
+        return dict(validators.stats)
+
+
+def reset_stats():
+    with validators.lock:
+        validators.reset_stats()
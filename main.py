@@ -1,64 +1,59 @@
-import os
 import json
-import sqlite3
-import requests
+import hashlib
+import logging
 from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify, redirect, url_for
+from flask import (Flask, Response, render_template, stream_template, stream_with_context,
+                   request, jsonify, redirect, url_for, abort)
 from apscheduler.schedulers.background import BackgroundScheduler
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from bs4 import BeautifulSoup
-import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+import db
+import export
+import history
+import metrics
+import migrations
+import notifications
+import profiler
+import rules
+import runs
+import sinks
+import view_cache
+import scheduling
+import http_client
+from parsers import parse_listings
+from seen_index import SeenIndex
+
+logging.basicConfig(level=Config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config.from_object(Config)
 Config.init_app(app)
+db.configure(app.config['DATABASE_NAME'])
+# Request threads are short-lived; give their connection back to the pool
+app.teardown_appcontext(db.release_connection)
+
+@app.template_filter('timestamp')
+def format_timestamp(value):
+    """Render a unix timestamp as local time"""
+    if not isinstance(value, (int, float)):
+        return value or ''
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS properties
-                 (id TEXT PRIMARY KEY, 
-                  url TEXT,
-                  title TEXT,
-                  price TEXT,
-                  location TEXT,
-                  seller_type TEXT,
-                  first_seen TIMESTAMP,
-                  notified INTEGER DEFAULT 0)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS search_configs
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT,
-                  province TEXT,
-                  property_type TEXT,
-                  min_price INTEGER,
-                  max_price INTEGER,
-                  seller_type TEXT,
-                  active INTEGER DEFAULT 1)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS settings
-                 (key TEXT PRIMARY KEY,
-                  value TEXT)''')
-    
-    # Insert default settings if not exist
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_enabled', '0')")
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_from', '')")
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_password', '')")
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_to', '')")
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('check_interval', '60')")
-    c.execute("INSERT OR IGNORE INTO settings VALUES ('last_check', '')")
-    
-    conn.commit()
-    conn.close()
+    migrations.migrate()
 
 init_db()
 
+# Known property IDs, so most duplicates are rejected without touching SQLite
+seen_properties = SeenIndex(Config.SEEN_INDEX_CAPACITY, Config.SEEN_INDEX_ERROR_RATE)
+seen_properties.load(db.get_connection())
+
 # HTML Templates
 DASHBOARD_TEMPLATE = '''
 <!DOCTYPE html>
@@ -76,6 +71,7 @@ DASHBOARD_TEMPLATE = '''
         .nav { display: flex; gap: 1rem; margin-bottom: 2rem; flex-wrap: wrap; }
         .nav a { padding: 0.75rem 1.5rem; background: white; color: #667eea; text-decoration: none; border-radius: 8px; font-weight: 600; transition: all 0.3s; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }
         .nav a:hover { transform: translateY(-2px); box-shadow: 0 4px 12px rgba(0,0,0,0.1); }
+        .nav button { padding: 0.75rem 1.5rem; background: white; color: #667eea; border: none; border-radius: 8px; font: inherit; font-weight: 600; cursor: pointer; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }
         .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 1.5rem; margin-bottom: 2rem; }
         .stat-card { background: white; padding: 1.5rem; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.05); }
         .stat-card h3 { color: #64748b; font-size: 0.875rem; font-weight: 600; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.5rem; }
@@ -113,9 +109,10 @@ DASHBOARD_TEMPLATE = '''
     <div class="container">
         <div class="nav">
             <a href="/">Dashboard</a>
+            <a href="/properties">Alle Panden</a>
             <a href="/searches">Zoekopdrachten</a>
             <a href="/settings">Instellingen</a>
-            <a href="/run-check">Check Nu</a>
+            <form method="POST" action="/run-check"><button type="submit">Check Nu</button></form>
         </div>
         
         <div class="stats">
@@ -137,6 +134,19 @@ DASHBOARD_TEMPLATE = '''
             </div>
         </div>
         
+        {% if job %}
+        <div class="properties" id="job">Check {{ job }} staat in de wachtrij...</div>
+        <script>
+            const events = new EventSource('/jobs/{{ job }}/events');
+            events.addEventListener('progress', (e) => {
+                const job = JSON.parse(e.data);
+                document.getElementById('job').textContent = `Check ${job.id}: ${job.status}, ` +
+                    `${job.done_searches}/${job.total_searches} zoekopdrachten, ${job.new_count} nieuwe panden`;
+            });
+            events.addEventListener('done', () => events.close());
+        </script>
+        {% endif %}
+        
         <div class="properties">
             <h2>Recente Vondsten</h2>
             {% if properties %}
@@ -152,9 +162,9 @@ DASHBOARD_TEMPLATE = '''
                     </div>
                     <div class="property-meta">
                         <span>💰 {{ prop.price }}</span>
-                        <span>📍 {{ prop.location }}</span>
+                        {% if prop.location %}<span>📍 {{ prop.location }}</span>{% endif %}
                         <span>👤 {{ prop.seller_type }}</span>
-                        <span>🕐 {{ prop.first_seen }}</span>
+                        <span>🕐 {{ prop.first_seen|timestamp }}</span>
                     </div>
                     <a href="{{ prop.url }}" target="_blank" class="property-link">Bekijk op Immoweb →</a>
                 </div>
@@ -218,6 +228,7 @@ SEARCHES_TEMPLATE = '''
     <div class="container">
         <div class="nav">
             <a href="/">Dashboard</a>
+            <a href="/properties">Alle Panden</a>
             <a href="/searches">Zoekopdrachten</a>
             <a href="/settings">Instellingen</a>
         </div>
@@ -286,6 +297,10 @@ SEARCHES_TEMPLATE = '''
                                 <span>🏠 {{ search.property_type }}</span>
                                 <span>💰 €{{ search.min_price }} - €{{ search.max_price }}</span>
                                 <span>👤 {{ search.seller_type }}</span>
+                                {% if search.poll_interval %}
+                                <span>⏱ elke {{ search.poll_interval|round|int }} min</span>
+                                <span>📈 {{ '%.2f'|format(search.velocity or 0) }} nieuw/uur</span>
+                                {% endif %}
                             </div>
                         </div>
                         <div class="search-actions">
@@ -305,6 +320,88 @@ SEARCHES_TEMPLATE = '''
                 {% endif %}
             </div>
         </div>
+        
+        <div class="card">
+            <h2>Notificatieregels</h2>
+            <p style="color: #64748b; margin-bottom: 1.5rem;">Elke ontvanger krijgt de panden die aan een van zijn regels voldoen. De regel "Alle panden" stuurt elke nieuwe vondst naar het standaard email adres; verwijder die om enkel panden te melden die aan een andere regel voldoen.</p>
+            <form method="POST" action="/add-rule">
+                <div class="form-group">
+                    <label>Naam regel</label>
+                    <input type="text" name="name" required placeholder="Bijv. Goedkope huizen met tuin">
+                </div>
+                <div class="form-group">
+                    <label>Zoekopdracht</label>
+                    <select name="search_id">
+                        <option value="">Alle zoekopdrachten</option>
+                        {% for search in searches %}
+                        <option value="{{ search.id }}">{{ search.name }}</option>
+                        {% endfor %}
+                    </select>
+                </div>
+                <div class="form-group">
+                    <label>Ontvangers (komma gescheiden, leeg = standaard email adres)</label>
+                    <input type="text" name="recipients" placeholder="jan@voorbeeld.be, an@voorbeeld.be">
+                </div>
+                <div class="form-group">
+                    <label>Moet een van deze woorden bevatten</label>
+                    <input type="text" name="include_keywords" placeholder="tuin, garage">
+                </div>
+                <div class="form-group">
+                    <label>Mag geen van deze woorden bevatten</label>
+                    <input type="text" name="exclude_keywords" placeholder="renovatie, lijfrente">
+                </div>
+                <div class="form-group">
+                    <label>Min. prijs (EUR)</label>
+                    <input type="number" name="min_price">
+                </div>
+                <div class="form-group">
+                    <label>Max. prijs (EUR)</label>
+                    <input type="number" name="max_price">
+                </div>
+                <div class="form-group">
+                    <label>Max. prijs per m² (EUR)</label>
+                    <input type="number" name="max_price_per_m2">
+                </div>
+                <div class="form-group">
+                    <label>Min. slaapkamers</label>
+                    <input type="number" name="min_bedrooms">
+                </div>
+                <div class="form-group">
+                    <label>Verkoper type</label>
+                    <select name="seller_type">
+                        <option value="all">Allemaal</option>
+                        <option value="private">Alleen particulieren</option>
+                        <option value="agency">Alleen makelaars</option>
+                    </select>
+                </div>
+                <button type="submit" class="btn">Regel Toevoegen</button>
+            </form>
+            
+            <div class="search-list" style="margin-top: 2rem;">
+                {% for rule in rules %}
+                <div class="search-item">
+                    <div class="search-info">
+                        <h3>{{ rule.name }}</h3>
+                        <div class="search-meta">
+                            <span>🔍 {{ rule.search_name or 'Alle zoekopdrachten' }}</span>
+                            <span>✉️ {{ rule.recipients or 'standaard' }}</span>
+                            {% if rule.include_keywords %}<span>➕ {{ rule.include_keywords }}</span>{% endif %}
+                            {% if rule.exclude_keywords %}<span>➖ {{ rule.exclude_keywords }}</span>{% endif %}
+                            {% if rule.min_price or rule.max_price %}<span>💰 €{{ rule.min_price or 0 }} - €{{ rule.max_price or '∞' }}</span>{% endif %}
+                            {% if rule.max_price_per_m2 %}<span>📐 max €{{ rule.max_price_per_m2 }}/m²</span>{% endif %}
+                            {% if rule.min_bedrooms %}<span>🛏 {{ rule.min_bedrooms }}+</span>{% endif %}
+                            <span>👤 {{ rule.seller_type }}</span>
+                        </div>
+                    </div>
+                    <div class="search-actions">
+                        <form method="POST" action="/delete-rule/{{ rule.id }}" style="display: inline;">
+                            <button type="submit" class="btn btn-delete">Verwijderen</button>
+                        </form>
+                    </div>
+                </div>
+                {% endfor %}
+            </div>
+        </div>
     </div>
 </body>
 </html>
@@ -349,6 +446,7 @@ SETTINGS_TEMPLATE = '''
     <div class="container">
         <div class="nav">
             <a href="/">Dashboard</a>
+            <a href="/properties">Alle Panden</a>
             <a href="/searches">Zoekopdrachten</a>
             <a href="/settings">Instellingen</a>
         </div>
@@ -391,6 +489,27 @@ SETTINGS_TEMPLATE = '''
             </form>
         </div>
         
+        <div class="card">
+            <h2>Profiler</h2>
+            <form method="POST" action="/admin/profiles">
+                <div class="form-group">
+                    <label>Aantal checks profileren</label>
+                    <input type="number" name="runs" value="{{ profile_runs }}" min="0" max="100">
+                    <small>De volgende checks worden met een sampling profiler opgenomen (0 = uit). Nog {{ profile_runs }} te gaan.</small>
+                </div>
+                <button type="submit" class="btn">Profiler Instellen</button>
+            </form>
+            {% if profiles %}
+            <ul style="margin-left: 1.5rem; margin-top: 1.5rem;">
+                {% for profile in profiles %}
+                <li><a href="/admin/profiles/{{ profile.id }}">Profiel {{ profile.id }}</a> -
+                    {{ profile.started_at|timestamp }}, {{ '%.1f'|format(profile.seconds or 0) }}s,
+                    {{ profile.samples }} samples, {{ profile.new_count or 0 }} nieuwe panden</li>
+                {% endfor %}
+            </ul>
+            {% endif %}
+        </div>
+        
         <div class="card">
             <h2>Systeem Info</h2>
             <div class="alert alert-info">
@@ -407,193 +526,697 @@ SETTINGS_TEMPLATE = '''
 </html>
 '''
 
+PROPERTIES_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Alle Panden - Immoweb Prospectie</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Arial, sans-serif; background: #f5f7fa; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 2rem; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .container { max-width: 1200px; margin: 0 auto; padding: 2rem; }
+        .nav { display: flex; gap: 1rem; margin-bottom: 2rem; flex-wrap: wrap; }
+        .nav a { padding: 0.75rem 1.5rem; background: white; color: #667eea; text-decoration: none; border-radius: 8px; font-weight: 600; transition: all 0.3s; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }
+        .card { background: white; border-radius: 12px; padding: 1.5rem; box-shadow: 0 2px 10px rgba(0,0,0,0.05); margin-bottom: 2rem; }
+        .filters { display: grid; grid-template-columns: repeat(auto-fit, minmax(180px, 1fr)); gap: 1rem; align-items: end; }
+        .filters label { display: block; margin-bottom: 0.5rem; color: #475569; font-weight: 600; font-size: 0.875rem; }
+        .filters input, .filters select { width: 100%; padding: 0.6rem; border: 2px solid #e2e8f0; border-radius: 8px; font-size: 1rem; }
+        .btn { display: inline-block; padding: 0.7rem 1.5rem; background: #667eea; color: white; border: none; border-radius: 8px; font-weight: 600; cursor: pointer; text-decoration: none; }
+        .btn:hover { background: #5568d3; }
+        table { width: 100%; border-collapse: collapse; font-size: 0.875rem; }
+        th, td { text-align: left; padding: 0.6rem; border-bottom: 1px solid #e2e8f0; }
+        th { color: #64748b; text-transform: uppercase; font-size: 0.75rem; letter-spacing: 0.05em; }
+        td a { color: #667eea; text-decoration: none; }
+        .pager { margin-top: 1.5rem; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div class="container">
+            <h1>📋 Alle Panden</h1>
+        </div>
+    </div>
+    
+    <div class="container">
+        <div class="nav">
+            <a href="/">Dashboard</a>
+            <a href="/properties">Alle Panden</a>
+            <a href="/searches">Zoekopdrachten</a>
+            <a href="/settings">Instellingen</a>
+        </div>
+        
+        <div class="card">
+            <form method="GET" action="/properties" class="filters">
+                <div>
+                    <label>Locatie</label>
+                    <input type="text" name="location" value="{{ filters.location or '' }}" placeholder="antwerp">
+                </div>
+                <div>
+                    <label>Postcode</label>
+                    <input type="text" name="postal_code" value="{{ filters.postal_code or '' }}" placeholder="2000">
+                </div>
+                <div>
+                    <label>Verkoper type</label>
+                    <select name="seller_type">
+                        <option value="">Allemaal</option>
+                        <option value="Particulier" {% if filters.seller_type == 'Particulier' %}selected{% endif %}>Particulier</option>
+                        <option value="Makelaar" {% if filters.seller_type == 'Makelaar' %}selected{% endif %}>Makelaar</option>
+                    </select>
+                </div>
+                <div>
+                    <label>Min. prijs (EUR)</label>
+                    <input type="number" name="min_price" value="{{ filters.min_price or '' }}">
+                </div>
+                <div>
+                    <label>Max. prijs (EUR)</label>
+                    <input type="number" name="max_price" value="{{ filters.max_price or '' }}">
+                </div>
+                <div>
+                    <button type="submit" class="btn">Filteren</button>
+                </div>
+            </form>
+        </div>
+        
+        <div class="card">
+            <table>
+                <tr><th>Gevonden</th><th>Titel</th><th>Prijs</th><th>Locatie</th><th>Verkoper</th></tr>
+                {% for prop in properties %}
+                <tr>
+                    <td>{{ prop.first_seen|timestamp }}</td>
+                    <td><a href="{{ prop.url }}" target="_blank">{{ prop.title }}</a></td>
+                    <td>{{ prop.price }}</td>
+                    <td>{{ prop.location or '' }}</td>
+                    <td>{{ prop.seller_type }}</td>
+                </tr>
+                {% endfor %}
+            </table>
+            {% if page.next_cursor %}
+            <div class="pager">
+                <a class="btn" href="{{ page.next_url }}">Volgende pagina →</a>
+            </div>
+            {% endif %}
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+# Compiled once at startup; render_template accepts the Template objects directly
+DASHBOARD_PAGE = app.jinja_env.from_string(DASHBOARD_TEMPLATE)
+SEARCHES_PAGE = app.jinja_env.from_string(SEARCHES_TEMPLATE)
+SETTINGS_PAGE = app.jinja_env.from_string(SETTINGS_TEMPLATE)
+PROPERTIES_PAGE = app.jinja_env.from_string(PROPERTIES_TEMPLATE)
+
 # Helper functions
+_settings_cache = None  # (settings_version, values)
+_settings_lock = threading.Lock()
+
+def get_settings():
+    """Return all settings, reloading the settings table when any process changed it"""
+    global _settings_cache
+    version = db.counter('settings_version')
+    with _settings_lock:
+        if _settings_cache is None or _settings_cache[0] != version:
+            _settings_cache = (version, {row[0]: row[1] for row in db.query("SELECT key, value FROM settings")})
+        return dict(_settings_cache[1])
+
 def get_setting(key):
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
+    return get_settings().get(key)
+
+def set_settings(values):
+    """Write several settings in one transaction; the version bump makes every process reload them"""
+    with db.transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         list(values.items()))
+    view_cache.invalidate()
 
 def set_setting(key, value):
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    set_settings({key: value})
 
-def send_email_notification(properties):
-    if get_setting('email_enabled') != '1':
-        return
+def invalidate_settings():
+    global _settings_cache
+    with _settings_lock:
+        _settings_cache = None
+
+PROPERTY_FILTERS = ('location', 'postal_code', 'seller_type', 'min_price', 'max_price')
+
+def property_filters(args):
+    """WHERE clauses and parameters for the optional property filters"""
+    where = []
+    params = []
+    if args.get('location'):
+        where.append("location = ?")
+        params.append(args['location'])
+    if args.get('postal_code'):
+        where.append("postal_code = ?")
+        params.append(args['postal_code'])
+    if args.get('seller_type'):
+        where.append("seller_type = ?")
+        params.append(args['seller_type'])
+    if args.get('min_price'):
+        where.append("price_value >= ?")
+        params.append(int(args['min_price']))
+    if args.get('max_price'):
+        where.append("price_value <= ?")
+        params.append(int(args['max_price']))
+    return where, params
+
+def property_query(args, limit):
+    """Build a keyset-paginated properties query from request arguments
+
+    Pages are ordered newest first on (first_seen, id); the cursor is the
+    key of the last row of the previous page, so every page is an index seek.
+    """
+    where, params = property_filters(args)
+    if args.get('cursor'):
+        first_seen, _, property_id = args['cursor'].partition('_')
+        where.append("(first_seen, id) < (?, ?)")
+        params.extend([int(first_seen), property_id])
+    
+    sql = "SELECT * FROM properties"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY first_seen DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+def iter_property_page(sql, params, limit, page):
+    """Yield one page of properties straight from the cursor
+
+    Sets page['next_cursor'] once it is known that another page follows.
+    """
+    c = db.get_connection().execute(sql, params)
+    count = 0
+    last = None
+    while True:
+        rows = c.fetchmany(100)
+        if not rows:
+            break
+        for row in rows:
+            if count == limit:
+                page['next_cursor'] = f"{last['first_seen']}_{last['id']}"
+                c.close()
+                return
+            count += 1
+            last = row
+            yield dict(row)
+
+def property_head():
+    """Sequence number of the newest stored property (0 when there are none)"""
+    row = db.query_one("SELECT value FROM counters WHERE name = 'properties_seq'")
+    return row[0] if row else 0
+
+def properties_since(args, since, head, limit):
+    """
+    Properties inserted after sequence number since, oldest first
     
-    email_from = get_setting('email_from')
-    email_password = get_setting('email_password')
-    email_to = get_setting('email_to')
+    Only rows up to head are read, so a page is consistent with the head the
+    caller saw. Returns (properties, cursor, more); cursor is what to pass as
+    since next time.
+    """
+    where, params = property_filters(args)
+    rows = db.query(f"""SELECT * FROM properties WHERE {' AND '.join(['seq > ?', 'seq <= ?'] + where)}
+                        ORDER BY seq LIMIT ?""", [since, head] + params + [limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return [dict(row) for row in rows], rows[-1]['seq'], True
+    return [dict(row) for row in rows], max(since, head), False
+
+def page_limit(default=50, maximum=500):
+    try:
+        return max(1, min(int(request.args.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+mailer = notifications.SmtpMailer()
+
+def email_settings():
+    """(from, password, to) when email is switched on and configured, else None"""
+    settings_data = get_settings()
+    if settings_data.get('email_enabled') != '1':
+        return None
+    
+    email_from = settings_data.get('email_from')
+    email_password = settings_data.get('email_password')
+    email_to = settings_data.get('email_to')
     
     if not all([email_from, email_password, email_to]):
-        print("Email settings incomplete")
-        return
+        logger.warning("Email settings incomplete")
+        return None
+    return email_from, email_password, email_to
+
+def route_email_notification(properties):
+    """
+    Map recipient -> properties for a batch of outbox rows; called by the notification worker
     
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'🏠 {len(properties)} nieuwe panden gevonden op Immoweb'
-        msg['From'] = email_from
-        msg['To'] = email_to
-        
-        html = '<html><body style="font-family: Arial, sans-serif;">'
-        html += f'<h2>Er zijn {len(properties)} nieuwe panden gevonden!</h2>'
-        
-        for prop in properties:
-            html += f'''
-            <div style="border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 8px;">
-                <h3>{prop['title']}</h3>
-                <p><strong>Prijs:</strong> {prop['price']}</p>
-                <p><strong>Locatie:</strong> {prop['location']}</p>
-                <p><strong>Type verkoper:</strong> {prop['seller_type']}</p>
-                <a href="{prop['url']}" style="display: inline-block; padding: 10px 20px; background: #667eea; color: white; text-decoration: none; border-radius: 5px;">Bekijk pand</a>
-            </div>
-            '''
-        
-        html += '</body></html>'
-        
-        msg.attach(MIMEText(html, 'html'))
+    Returns None when email is switched off or not configured.
+    """
+    settings = email_settings()
+    if settings is None:
+        return None
+    # Notification rules decide who gets which property; without rules everything goes to email_to
+    routes = rules.get_engine().route(properties, rules.split_list(settings[2]))
+    if not routes:
+        logger.info("No notification rule matched %d properties", len(properties))
+    return routes
+
+def send_email_notification(properties):
+    """
+    Send one digest email to the recipient of a routed batch; called by the notification worker
+    
+    Returns False when email is switched off or not configured, so the batch
+    counts as handled; raises when sending fails so the batch is retried.
+    """
+    settings = email_settings()
+    if settings is None:
+        return False
+    email_from, email_password, _ = settings
+    recipient = properties[0]['recipient']
+    
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = notifications.digest_subject(properties)
+    msg['From'] = email_from
+    msg['To'] = recipient
+    msg.attach(MIMEText(notifications.render_digest(properties), 'html'))
+    with metrics.span('email_send'):
+        mailer.send(msg, email_from, email_password)
+    logger.info("Email sent to %s for %d properties", recipient, len(properties))
+    return True
+
+NOTIFICATION_SINKS = sinks.configured_sinks(send_email_notification, route_email_notification,
+                                            on_email_idle=mailer.close_idle)
+# A sink whose URL was removed from the config has no worker to deliver its rows
+abandoned = notifications.abandon_channels([sink.name for sink in NOTIFICATION_SINKS])
+if abandoned:
+    logger.warning("Abandoned %d outbox rows of sinks that are no longer configured", abandoned)
+
+SEARCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def search_page_url(search_config, page=1):
+    """Result page URL for a search, newest listings first"""
+    base_url = f"{Config.IMMOWEB_BASE_URL}/en/search"
+    # Construct URL (simplified - actual Immoweb URL structure may vary)
+    return (f"{base_url}/{search_config['property_type']}/for-sale/{search_config['province']}/"
+            f"?minPrice={search_config['min_price']}&maxPrice={search_config['max_price']}"
+            f"&orderBy=newest&page={page}")
+
+# Notified after store_listings commits new rows, so property streams in this process wake up early
+_new_properties = threading.Condition()
+
+# Listings a search skipped because of its seller filter; they count as known when deciding to stop paging
+_skipped_listings = {}
+
+def set_last_recrawl(members, when):
+    """Record when the searches of a fetch last read all their pages (search_configs.last_recrawl)"""
+    ids = [member['id'] for member in members if member['id'] is not None]
+    if ids:
+        db.execute(f"UPDATE search_configs SET last_recrawl = ? WHERE id IN ({','.join('?' * len(ids))})",
+                   [when] + ids)
+
+def recrawl_due(members):
+    """
+    Whether a fetch should read past known listings so their price changes are seen
+    Due once the member search recrawled longest ago did so HISTORY_RECRAWL_HOURS
+    ago; claims the recrawl for all members when it is.
+    """
+    if Config.HISTORY_RECRAWL_HOURS <= 0:
+        return False
+    interval = Config.HISTORY_RECRAWL_HOURS * 3600
+    now = int(time.time())
+    last = []
+    for member in members:
+        if member['id'] is None:
+            continue
+        row = db.query_one("SELECT last_recrawl FROM search_configs WHERE id = ?", (member['id'],))
+        if row is None:
+            continue
+        if row[0] is None:
+            # Never recrawled: spread the first recrawl over the interval by search id, so searches added
+            # together (or all of them after an upgrade) do not all read every page in the same cycle
+            stagger = now - int(interval * (member['id'] * 0.618034 % 1))
+            set_last_recrawl([member], stagger)
+            last.append(stagger)
+        else:
+            last.append(row[0])
+    if not last or now - min(last) < interval:
+        return False
+    set_last_recrawl(members, now)
+    return True
+
+def store_listings(search_config, listings):
+    """
+    Insert the listings of one result page that are not known yet
+    Returns (new properties, number of listings that were unknown)
+    """
+    # Collect candidates first so the dedup check is a single query
+    candidates = {}
+    for listing in listings:
+        # Create unique ID for this property
+        property_id = history.property_id(listing)
+        candidates.setdefault(property_id, listing)
+    
+    skipped = _skipped_listings.setdefault(search_config['id'], set())
+    offered = len(candidates)
+    with metrics.span('dedup'):
+        candidates = {pid: value for pid, value in candidates.items()
+                      if pid not in seen_properties and pid not in skipped}
+    if not candidates:
+        metrics.inc('immoweb_listings_total', offered, result='duplicate')
+        return [], 0
+    
+    # Take the write lock up front so concurrent searches cannot insert the same ID twice
+    with db.transaction(immediate=True) as conn:
+        c = conn.cursor()
+        ids = list(candidates)
+        placeholders = ','.join('?' * len(ids))
+        with metrics.span('dedup'):
+            c.execute(f"SELECT id FROM properties WHERE id IN ({placeholders})", ids)
+            existing = {row[0] for row in c.fetchall()}
         
-        server = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server.login(email_from, email_password)
-        server.sendmail(email_from, email_to, msg.as_string())
-        server.quit()
+        timestamp = int(time.time())
+        rows = []
+        for property_id, listing in candidates.items():
+            if property_id in existing:
+                continue
+            
+            # Check seller type if filtering for private sellers
+            seller_type = listing['seller_type']
+            if search_config['seller_type'] == 'private' and seller_type != 'Particulier':
+                skipped.add(property_id)
+                continue
+            
+            prop = dict(listing, id=property_id, first_seen=timestamp, search_id=search_config['id'],
+                        content_hash=history.content_hash(listing))
+            rows.append(prop)
+            logger.debug("New property found: %s", prop['title'])
         
-        print(f"Email sent successfully for {len(properties)} properties")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+        with metrics.span('insert'):
+            c.executemany("""INSERT INTO properties 
+                             (id, url, title, price, price_value, location, seller_type, first_seen, notified,
+                              listing_id, postal_code, bedrooms, surface, search_id, content_hash)
+                             VALUES (:id, :url, :title, :price, :price_value, :location, :seller_type, :first_seen, 0,
+                                     :listing_id, :postal_code, :bedrooms, :surface, :search_id, :content_hash)""",
+                          rows)
+            history.snapshot_new(conn, rows)
+            # Queued in the same transaction, so a stored property is never left without its notification
+            notifications.enqueue(conn, [(row['id'], 1) for row in rows],
+                                  [sink.name for sink in NOTIFICATION_SINKS])
+    
+    seen_properties.add_many(existing)
+    seen_properties.add_many(row['id'] for row in rows)
+    metrics.inc('immoweb_listings_total', len(rows), result='new')
+    metrics.inc('immoweb_listings_total', offered - len(rows), result='duplicate')
+    if rows:
+        view_cache.invalidate()
+        with _new_properties:
+            _new_properties.notify_all()
+    if len(skipped) > 10000:
+        skipped.clear()
+    return rows, len(candidates) - len(existing)
 
-def scrape_immoweb(search_config):
+def _price_bound(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def in_price_range(search_config, listing):
+    """Apply a search's price band to a listing fetched by a wider group query"""
+    low = _price_bound(search_config['min_price'])
+    high = _price_bound(search_config['max_price'])
+    price = listing.get('price_value')
+    if price is None:
+        # Immoweb's own price filter leaves out listings without a price
+        return low is None and high is None
+    return (low is None or price >= low) and (high is None or price <= high)
+
+def plan_searches(search_configs):
+    """
+    Group searches that only differ in seller filter or in overlapping price bands
+    Returns (fetch config, member searches) pairs; each group is fetched once
+    with the union of its members' price bands. Disjoint bands stay separate
+    fetches, so no member has to page through listings outside its band.
+    """
+    groups = {}
+    for search_config in search_configs:
+        groups.setdefault((search_config['province'], search_config['property_type']), []).append(search_config)
+    
+    plan = []
+    for (province, property_type), searches in groups.items():
+        clusters = []
+        for search_config in sorted(searches, key=lambda s: _price_bound(s['min_price']) or 0):
+            low = _price_bound(search_config['min_price']) or 0
+            high = _price_bound(search_config['max_price'])
+            if clusters and (clusters[-1][1] is None or low <= clusters[-1][1]):
+                cluster = clusters[-1]
+                cluster[1] = None if high is None or cluster[1] is None else max(cluster[1], high)
+                cluster[2].append(search_config)
+            else:
+                clusters.append([low, high, [search_config]])
+        for _, _, members in clusters:
+            lows = [_price_bound(m['min_price']) for m in members]
+            highs = [_price_bound(m['max_price']) for m in members]
+            fetch_config = {
+                'id': None,
+                'name': ', '.join(m['name'] for m in members),
+                'province': province,
+                'property_type': property_type,
+                'min_price': '' if None in lows else min(lows),
+                'max_price': '' if None in highs else max(highs),
+                'seller_type': 'all'
+            }
+            plan.append((fetch_config, members))
+    return plan
+
+def scrape_immoweb(search_config, members=None):
     """
     Scrapes Immoweb based on search configuration
     Returns list of new properties
+    
+    With members, search_config is a widened group query (see plan_searches)
+    and each result page is fanned out to the member searches' own filters.
+    Every member keeps its own MAX_RESULTS_PER_SEARCH budget and stops on
+    its own once caught up, as if it had been fetched alone; the group may
+    read up to MAX_PAGES_PER_SEARCH pages per member.
+    
+    Paging normally stops once every member has caught up or the page is
+    unchanged (304). Every HISTORY_RECRAWL_HOURS, and after a pass that
+    failed halfway, a pass reads all pages unconditionally, so listings
+    deeper in the results are still checked for price changes and stored
+    if an earlier pass missed them.
     """
+    members = members or [search_config]
     new_properties = []
     
+    # Note: This is a simplified scraper. Immoweb may require more sophisticated handling
+    # Including headers, session management, and potentially dealing with JavaScript rendering
+    
+    fetched = []
     try:
-        # Build Immoweb search URL
-        base_url = "https://www.immoweb.be/en/search"
-        params = {
-            'countries': 'BE',
-            'propertyTypes': search_config['property_type'].upper(),
-            'provinces': search_config['province'].upper().replace('-', '_'),
-            'minPrice': search_config['min_price'],
-            'maxPrice': search_config['max_price']
-        }
-        
-        # Note: This is a simplified scraper. Immoweb may require more sophisticated handling
-        # Including headers, session management, and potentially dealing with JavaScript rendering
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Construct URL (simplified - actual Immoweb URL structure may vary)
-        search_url = f"{base_url}/{search_config['property_type']}/for-sale/{search_config['province']}/?minPrice={search_config['min_price']}&maxPrice={search_config['max_price']}"
-        
-        print(f"Searching: {search_url}")
-        
-        response = requests.get(search_url, headers=headers, timeout=10)
-        
-        if response.status_code != 200:
-            print(f"Failed to fetch: {response.status_code}")
-            return new_properties
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find property listings - this selector may need adjustment based on actual Immoweb structure
-        # This is a generic approach that should work for most real estate sites
-        listings = soup.find_all('article') or soup.find_all('div', class_=lambda x: x and 'card' in x.lower())
-        
-        for listing in listings[:20]:  # Limit to first 20 results
-            try:
-                # Extract property info - selectors may need adjustment
-                title_elem = listing.find('h2') or listing.find('h3') or listing.find('a')
-                price_elem = listing.find(text=lambda t: t and '€' in str(t))
-                link_elem = listing.find('a', href=True)
-                
-                if not link_elem:
+        processed = {member['id']: 0 for member in members}
+        active = list(members)
+        recrawl = recrawl_due(members)
+        for page in range(1, Config.MAX_PAGES_PER_SEARCH * len(members) + 1):
+            search_url = search_page_url(search_config, page)
+            fetched.append(search_url)
+            logger.debug("Searching: %s", search_url)
+            
+            with metrics.span('fetch'):
+                response = http_client.get(search_url, headers=SEARCH_HEADERS, conditional=True,
+                                           refresh=recrawl)
+            metrics.inc('immoweb_pages_fetched_total', status=response.status_code)
+            
+            if response.status_code == 304:
+                logger.debug("Not modified: %s", search_url)
+                break
+            
+            if response.status_code != 200:
+                logger.warning("Failed to fetch %s: %s", search_url, response.status_code)
+                break
+            
+            with metrics.span('parse'):
+                listings = parse_listings(response.content)
+            if not listings:
+                break
+            metrics.inc('immoweb_listings_parsed_total', len(listings))
+            
+            for member in list(active):
+                in_band = [listing for listing in listings if in_price_range(member, listing)]
+                in_band = in_band[:Config.MAX_RESULTS_PER_SEARCH - processed[member['id']]]
+                if not in_band:
                     continue
-                
-                url
-              url = link_elem['href']
-                if not url.startswith('http'):
-                    url = 'https://www.immoweb.be' + url
-                
-                title = title_elem.get_text(strip=True) if title_elem else 'Geen titel'
-                price = price_elem if price_elem else 'Prijs op aanvraag'
-                
-                # Create unique ID for this property
-                property_id = hashlib.md5(url.encode()).hexdigest()
-                
-                # Check if we already have this property
-                conn = sqlite3.connect(app.config['DATABASE_NAME'])
-                c = conn.cursor()
-                c.execute("SELECT id FROM properties WHERE id = ?", (property_id,))
-                exists = c.fetchone()
-                
-                if not exists:
-                    # Check seller type if filtering for private sellers
-                    seller_type = 'Particulier' if 'particulier' in listing.get_text().lower() else 'Makelaar'
-                    
-                    if search_config['seller_type'] == 'private' and seller_type != 'Particulier':
-                        conn.close()
-                        continue
-                    
-                    # New property found!
-                    location = search_config['province']
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    c.execute("""INSERT INTO properties 
-                                 (id, url, title, price, location, seller_type, first_seen, notified)
-                                 VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
-                              (property_id, url, title, price, location, seller_type, timestamp))
-                    conn.commit()
-                    
-                    new_properties.append({
-                        'id': property_id,
-                        'url': url,
-                        'title': title,
-                        'price': price,
-                        'location': location,
-                        'seller_type': seller_type
-                    })
-                    
-                    print(f"New property found: {title}")
-                
-                conn.close()
-                
-            except Exception as e:
-                print(f"Error parsing listing: {e}")
-                continue
-        
-        # Small delay to be respectful
-        time.sleep(2)
+                processed[member['id']] += len(in_band)
+                found, member_unseen = store_listings(member, in_band)
+                new_properties.extend(found)
+                # Results are sorted newest first, so a page without unseen listings means it has caught up;
+                # a recrawl reads on to pick up listings an earlier pass missed
+                if (not member_unseen and not recrawl) or processed[member['id']] >= Config.MAX_RESULTS_PER_SEARCH:
+                    active.remove(member)
+            
+            # Listings we already had may have changed price; drops go out through the outbox
+            with metrics.span('history'):
+                drops = history.track(listings, [sink.name for sink in NOTIFICATION_SINKS])
+            for _, title, old_price, new_price in drops:
+                logger.info("Price drop: %s %s -> %s", title, old_price, new_price)
+            
+            if not active and not recrawl:
+                break
         
     except Exception as e:
-        print(f"Error scraping Immoweb: {e}")
+        logger.exception("Error scraping Immoweb: %s", e)
+        # Validators were stored on arrival, and the pages read so far are known now; without this the
+        # next cycle would get a 304 or stop early and never store the listings of the failed page
+        http_client.forget(fetched)
+        set_last_recrawl(members, 0)
     
     return new_properties
 
-def check_for_new_properties():
-    """Main function to check all active searches for new properties"""
-    print(f"Starting property check at {datetime.now()}")
+def update_search_schedule(search_configs, new_properties):
+    """Feed this cycle's results into each search's velocity and re-plan all poll intervals"""
+    now = int(time.time())
+    base_interval = int(get_setting('check_interval') or Config.CHECK_INTERVAL)
+    counts = {}
+    for prop in new_properties:
+        counts[prop.get('search_id')] = counts.get(prop.get('search_id'), 0) + 1
     
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("SELECT * FROM search_configs WHERE active = 1")
-    searches = c.fetchall()
-    conn.close()
+    with db.transaction(immediate=True) as conn:
+        for search_config in search_configs:
+            row = conn.execute("SELECT velocity, last_checked FROM search_configs WHERE id = ?",
+                               (search_config['id'],)).fetchone()
+            if row is None:
+                continue
+            elapsed = now - row['last_checked'] if row['last_checked'] else base_interval * 60
+            # Back-to-back manual checks must not turn one listing into a huge hourly rate
+            elapsed = max(elapsed, Config.MIN_POLL_INTERVAL * 60)
+            velocity = scheduling.update_velocity(row['velocity'], counts.get(search_config['id'], 0), elapsed)
+            conn.execute("UPDATE search_configs SET velocity = ?, last_checked = ? WHERE id = ?",
+                         (velocity, now, search_config['id']))
+    reschedule_searches(base_interval)
+
+def reschedule_searches(base_interval=None):
+    """Spread the polling budget over active searches according to their velocity"""
+    base_interval = base_interval or int(get_setting('check_interval') or Config.CHECK_INTERVAL)
+    with db.transaction(immediate=True) as conn:
+        rows = conn.execute("SELECT id, velocity, last_checked FROM search_configs WHERE active = 1").fetchall()
+        intervals = scheduling.allocate_intervals({row['id']: row['velocity'] for row in rows}, base_interval)
+        for row in rows:
+            interval = intervals[row['id']]
+            next_check = int((row['last_checked'] or time.time()) + interval * 60)
+            conn.execute("UPDATE search_configs SET poll_interval = ?, next_check = ? WHERE id = ?",
+                         (interval, next_check, row['id']))
+    view_cache.invalidate()
+
+def scheduled_check():
+    """Scheduler tick: only check searches whose adaptive interval has elapsed"""
+    return check_for_new_properties(only_due=True)
+
+_run_lock = threading.Lock()
+_full_run_requested = threading.Event()
+# Notified whenever a run records progress, so job event streams in this process wake up early
+_run_progress = threading.Condition()
+
+def notify_progress():
+    with _run_progress:
+        _run_progress.notify_all()
+
+def check_for_new_properties(only_due=False, run_id=None):
+    """
+    Main function to check all active searches for new properties
     
-    all_new_properties = []
+    Runs never overlap: a scheduler tick that finds a run in progress is
+    skipped, and a manual full check is coalesced into one extra pass after
+    the current run. A queued job (run_id from runs.queue_run) waits for the
+    current run instead and then runs under its own id. Returns the number
+    of new properties, or None when the run was skipped or queued.
+    """
+    if not only_due and run_id is None:
+        _full_run_requested.set()
+    if not _run_lock.acquire(blocking=run_id is not None):
+        logger.info("Property check already running; %s", "skipping tick" if only_due else "queued a full check")
+        return None
+    try:
+        owner = runs.acquire_lease()
+        if owner is None:
+            logger.info("Property check is running in another process; skipping")
+            if run_id is not None:
+                runs.finish_run(run_id, 0, 'skipped')
+                notify_progress()
+            return None
+        total = 0
+        requested = False
+        try:
+            # A resume only covers the crashed run's pending searches, so it leaves a requested full check queued
+            resumed = runs.interrupted_run()
+            if resumed:
+                with metrics.span('check_cycle'):
+                    total += run_check_cycle(owner, resumed=resumed)
+            while True:
+                requested = run_id is None and _full_run_requested.is_set()
+                full = run_id is not None or requested
+                _full_run_requested.clear()
+                with metrics.span('check_cycle'):
+                    total += run_check_cycle(owner, only_due=not full, run_id=run_id)
+                run_id = requested = None
+                if not _full_run_requested.is_set():
+                    return total
+        except Exception:
+            # Keep a requested full check for the next run rather than losing it with this one
+            if requested:
+                _full_run_requested.set()
+            # A queued job that never got to start must not stay 'queued' for its event stream
+            if run_id is not None:
+                runs.finish_run(run_id, total, 'failed')
+                notify_progress()
+            raise
+        finally:
+            runs.release_lease(owner)
+    finally:
+        _run_lock.release()
+
+def run_check_cycle(owner, only_due=False, run_id=None, resumed=None):
+    """One journaled check cycle: resumes an interrupted run, or starts (or claims a queued) run"""
+    if resumed:
+        run_id = resumed[0]
+        searches = runs.pending_searches(run_id)
+        logger.info("Resuming interrupted check run %s with %d searches left", run_id, len(searches))
+    else:
+        if only_due:
+            searches = db.query("SELECT * FROM search_configs WHERE active = 1 "
+                                "AND (next_check IS NULL OR next_check <= ?)", (int(time.time()),))
+            if not searches:
+                return 0
+        else:
+            searches = db.query("SELECT * FROM search_configs WHERE active = 1")
+        mode = 'manual' if run_id is not None else 'due' if only_due else 'all'
+        run_id = runs.start_run(mode, [search[0] for search in searches], run_id=run_id)
+    metrics.inc('immoweb_check_runs_total', mode='resume' if resumed else mode)
+    notify_progress()
+    # Only cycles with searches to check use up an armed profile
+    profile = profiler.begin() if searches else None
+    new_count = None
+    try:
+        new_count = check_searches(owner, run_id, searches)
+        return new_count
+    except Exception:
+        runs.finish_run(run_id, None, 'failed')
+        notify_progress()
+        raise
+    finally:
+        if profile:
+            profiler.finish(profile, new_count)
+
+def check_searches(owner, run_id, searches):
+    """Scrape the searches of a started run and record the results in its journal"""
+    logger.info("Starting property check run %s", run_id)
+    http_client.reset_stats()
     
+    search_configs = []
     for search in searches:
-        search_config = {
+        search_configs.append({
             'id': search[0],
             'name': search[1],
             'province': search[2],
@@ -601,46 +1224,75 @@ def check_for_new_properties():
             'min_price': search[4],
             'max_price': search[5],
             'seller_type': search[6]
-        }
-        
-        print(f"Checking search: {search_config['name']}")
-        new_props = scrape_immoweb(search_config)
-        all_new_properties.extend(new_props)
+        })
     
-    # Send notification if new properties found
+    def run_group(group):
+        fetch_config, members = group
+        logger.debug("Checking search: %s", fetch_config['name'])
+        started = time.time()
+        new_props = scrape_immoweb(fetch_config, members)
+        counts = {member['id']: 0 for member in members}
+        for prop in new_props:
+            counts[prop['search_id']] += 1
+        finished = time.time()
+        runs.mark_searches_done(run_id, counts, started, finished)
+        runs.renew_lease(owner)
+        notify_progress()
+        for member in members:
+            labels = {'search_id': member['id'], 'search': member['name']}
+            metrics.set_gauge('immoweb_search_last_run_timestamp_seconds', round(finished, 3), **labels)
+            metrics.set_gauge('immoweb_search_last_run_duration_seconds', round(finished - started, 3), **labels)
+            metrics.set_gauge('immoweb_search_last_new_properties', counts[member['id']], **labels)
+        return new_props
+    
+    def run_pooled(group):
+        try:
+            return run_group(group)
+        finally:
+            # The executor's threads end with this cycle
+            db.release_connection()
+    
+    # Overlapping searches share one fetch; groups run in parallel with politeness enforced per host by http_client
+    plan = plan_searches(search_configs)
+    logger.info("%d searches planned as %d fetch groups", len(search_configs), len(plan))
+    all_new_properties = []
+    with ThreadPoolExecutor(max_workers=max(1, Config.MAX_CONCURRENT_SEARCHES),
+                            thread_name_prefix=profiler.WORKER_PREFIX) as executor:
+        for new_props in executor.map(run_pooled, plan):
+            all_new_properties.extend(new_props)
+    
+    # New properties are already in the outbox; each sink's worker delivers them concurrently
     if all_new_properties:
-        print(f"Found {len(all_new_properties)} new properties total")
-        send_email_notification(all_new_properties)
-        
-        # Mark as notified
-        conn = sqlite3.connect(app.config['DATABASE_NAME'])
-        c = conn.cursor()
-        for prop in all_new_properties:
-            c.execute("UPDATE properties SET notified = 1 WHERE id = ?", (prop['id'],))
-        conn.commit()
-        conn.close()
+        logger.info("Found %d new properties total", len(all_new_properties))
+        for notifier in notifiers:
+            notifier.wake()
     else:
-        print("No new properties found")
+        logger.info("No new properties found")
+    
+    stats = http_client.stats()
+    logger.info("HTTP: %d requests, %d not modified, %d fetched, %d bytes received, ~%d bytes saved, "
+                "%.2fs total latency", stats['requests'], stats['hits'], stats['misses'], stats['bytes_received'],
+                stats['bytes_saved'], stats['seconds'])
+    stats = seen_properties.stats()
+    logger.info("Seen index: %d IDs, %d bytes, estimated false-positive rate %.5f",
+                stats['entries'], stats['bloom_bytes'] + stats['digest_bytes'], stats['estimated_error_rate'])
+    
+    update_search_schedule(search_configs, all_new_properties)
+    runs.finish_run(run_id, len(all_new_properties))
+    notify_progress()
     
     # Update last check time
     set_setting('last_check', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     
     return len(all_new_properties)
 
-# Routes
-@app.route('/')
-def dashboard():
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    
-    c.execute("SELECT COUNT(*) FROM properties")
-    total_properties = c.fetchone()[0]
+def dashboard_stats():
+    """Dashboard figures; rebuilt on the first request after the scraper (or any other writer) commits"""
+    c = db.get_connection().cursor()
     
-    c.execute("SELECT COUNT(*) FROM properties WHERE notified = 0")
-    new_properties = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM search_configs WHERE active = 1")
-    active_searches = c.fetchone()[0]
+    # Counters are maintained by triggers, so these stay O(1) as history grows
+    c.execute("SELECT name, value FROM counters")
+    counters = dict(c.fetchall())
     
     c.execute("SELECT * FROM properties ORDER BY first_seen DESC LIMIT 20")
     properties = []
@@ -656,24 +1308,148 @@ def dashboard():
             'notified': row[7]
         })
     
-    conn.close()
+    return {
+        'total_properties': counters.get('properties_total', 0),
+        'new_properties': counters.get('properties_unnotified', 0),
+        'active_searches': counters.get('searches_active', 0),
+        'properties': properties,
+        'last_check': get_setting('last_check'),
+    }
+
+# Routes
+@app.route('/')
+@view_cache.page
+def dashboard():
+    job = request.args.get('job', type=int)
+    return render_template(DASHBOARD_PAGE, job=job, **view_cache.value('dashboard', dashboard_stats))
+
+@app.route('/properties')
+def properties():
+    limit = page_limit()
+    try:
+        sql, params = property_query(request.args, limit)
+    except ValueError:
+        abort(400)
+    filters = {key: request.args.get(key) for key in PROPERTY_FILTERS}
+    page = {'next_cursor': None, 'next_url': None}
+    
+    def rows():
+        yield from iter_property_page(sql, params, limit, page)
+        if page['next_cursor']:
+            args = {key: value for key, value in filters.items() if value}
+            page['next_url'] = url_for('properties', cursor=page['next_cursor'], limit=limit, **args)
+    
+    return Response(stream_with_context(stream_template(
+        PROPERTIES_PAGE, properties=rows(), filters=filters, page=page)))
+
+@app.route('/api/properties')
+def api_properties():
+    limit = page_limit()
+    if 'since' in request.args:
+        return api_properties_since(limit)
+    try:
+        sql, params = property_query(request.args, limit)
+    except ValueError:
+        return jsonify({'error': 'invalid filter or cursor'}), 400
+    page = {'next_cursor': None}
+    
+    def generate():
+        yield '{"properties": ['
+        for i, prop in enumerate(iter_property_page(sql, params, limit, page)):
+            yield (',' if i else '') + json.dumps(prop)
+        yield '], "next_cursor": ' + json.dumps(page['next_cursor']) + '}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def api_properties_since(limit):
+    """Rows inserted after ?since=<cursor>, oldest first; 304 while the same query would return the same page"""
+    try:
+        since = int(request.args['since'])
+        property_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'invalid filter or cursor'}), 400
+    head = property_head()
+    # The page depends on since, limit and the filters, not only on the newest row
+    etag = f"properties-{head}-{hashlib.blake2b(request.query_string, digest_size=8).hexdigest()}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif head <= since:
+        response = jsonify({'properties': [], 'cursor': max(since, head), 'more': False})
+    else:
+        properties, cursor, more = properties_since(request.args, since, head, limit)
+        response = jsonify({'properties': properties, 'cursor': cursor, 'more': more})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/properties/events')
+def api_property_events():
+    """
+    Server-sent events with every property inserted after ?since= (or the Last-Event-ID on reconnect)
+    
+    The stream closes after EVENT_STREAM_MAX seconds so it does not hold a
+    sync worker forever; EventSource clients reconnect with Last-Event-ID.
+    """
+    limit = page_limit()
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since') or property_head())
+        property_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'invalid filter or cursor'}), 400
+    args = request.args.copy()
+    
+    def generate():
+        cursor = since
+        last_sent = time.time()
+        closes_at = last_sent + Config.EVENT_STREAM_MAX
+        yield f"retry: 5000\nid: {cursor}\n\n"
+        while time.time() < closes_at:
+            head = property_head()
+            if head > cursor:
+                properties, cursor, more = properties_since(args, cursor, head, limit)
+                if properties:
+                    last_sent = time.time()
+                    yield f"id: {cursor}\nevent: properties\ndata: {json.dumps({'properties': properties, 'cursor': cursor})}\n\n"
+                if more:
+                    continue
+            if time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+            # Woken early by scrapes in this process; the timeout covers other workers
+            with _new_properties:
+                _new_properties.wait(timeout=1)
     
-    last_check = get_setting('last_check')
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/export')
+def export_properties():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f'unknown format: {fmt}'}), 400
+    try:
+        since = export.parse_watermark(request.args.get('since'))
+        after, until = export.export_window(export.parse_sequence(request.args.get('after')))
+        chunks = export.stream(fmt, after, until, since)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        # The format is known but its optional dependency is not installed
+        return jsonify({'error': str(e)}), 501
     
-    return render_template_string(DASHBOARD_TEMPLATE,
-                                 total_properties=total_properties,
-                                 new_properties=new_properties,
-                                 active_searches=active_searches,
-                                 properties=properties,
-                                 last_check=last_check)
+    headers = {
+        'Content-Disposition': f'attachment; filename=properties-{until}.{fmt}',
+        # Pass this back as ?after= to fetch only newer rows next time
+        'X-Export-Watermark': str(until),
+    }
+    return Response(stream_with_context(chunks),
+                    mimetype=export.FORMATS[fmt], headers=headers)
 
 @app.route('/searches')
+@view_cache.page
 def searches():
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("SELECT * FROM search_configs")
     searches = []
-    for row in c.fetchall():
+    for row in db.query("SELECT * FROM search_configs"):
         searches.append({
             'id': row[0],
             'name': row[1],
@@ -682,11 +1458,15 @@ def searches():
             'min_price': row[4],
             'max_price': row[5],
             'seller_type': row[6],
-            'active': row[7]
+            'active': row[7],
+            'velocity': row['velocity'],
+            'poll_interval': row['poll_interval']
         })
-    conn.close()
     
-    return render_template_string(SEARCHES_TEMPLATE, searches=searches)
+    notification_rules = db.query("""SELECT r.*, s.name AS search_name FROM notification_rules r
+                                     LEFT JOIN search_configs s ON s.id = r.search_id ORDER BY r.id""")
+    
+    return render_template(SEARCHES_PAGE, searches=searches, rules=notification_rules)
 
 @app.route('/add-search', methods=['POST'])
 def add_search():
@@ -697,73 +1477,189 @@ def add_search():
     max_price = request.form.get('max_price', 999999999)
     seller_type = request.form.get('seller_type')
     
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("""INSERT INTO search_configs 
-                 (name, province, property_type, min_price, max_price, seller_type, active)
-                 VALUES (?, ?, ?, ?, ?, ?, 1)""",
-              (name, province, property_type, min_price, max_price, seller_type))
-    conn.commit()
-    conn.close()
+    db.execute("""INSERT INTO search_configs 
+                  (name, province, property_type, min_price, max_price, seller_type, active)
+                  VALUES (?, ?, ?, ?, ?, ?, 1)""",
+               (name, province, property_type, min_price, max_price, seller_type))
+    view_cache.invalidate()
     
     return redirect(url_for('searches'))
 
 @app.route('/delete-search/<int:search_id>', methods=['POST'])
 def delete_search(search_id):
-    conn = sqlite3.connect(app.config['DATABASE_NAME'])
-    c = conn.cursor()
-    c.execute("DELETE FROM search_configs WHERE id = ?", (search_id,))
-    conn.commit()
-    conn.close()
+    db.execute("DELETE FROM search_configs WHERE id = ?", (search_id,))
+    metrics.remove_gauges(search_id=search_id)
+    rules.invalidate()
+    view_cache.invalidate()
+    
+    return redirect(url_for('searches'))
+
+@app.route('/add-rule', methods=['POST'])
+def add_rule():
+    def number(field):
+        value = request.form.get(field, '').strip()
+        return int(value) if value.isdigit() else None
+    
+    db.execute("""INSERT INTO notification_rules
+                  (name, search_id, recipients, include_keywords, exclude_keywords,
+                   min_price, max_price, max_price_per_m2, min_bedrooms, seller_type, active)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)""",
+               (request.form.get('name'), number('search_id'), request.form.get('recipients', '').strip(),
+                request.form.get('include_keywords', '').strip(), request.form.get('exclude_keywords', '').strip(),
+                number('min_price'), number('max_price'), number('max_price_per_m2'), number('min_bedrooms'),
+                request.form.get('seller_type') or 'all'))
+    rules.invalidate()
+    view_cache.invalidate()
+    
+    return redirect(url_for('searches'))
+
+@app.route('/delete-rule/<int:rule_id>', methods=['POST'])
+def delete_rule(rule_id):
+    db.execute("DELETE FROM notification_rules WHERE id = ?", (rule_id,))
+    rules.invalidate()
+    view_cache.invalidate()
     
     return redirect(url_for('searches'))
 
 @app.route('/settings')
+@view_cache.page
 def settings():
+    stored = get_settings()
     settings_data = {
-        'email_enabled': get_setting('email_enabled'),
-        'email_from': get_setting('email_from') or '',
-        'email_password': get_setting('email_password') or '',
-        'email_to': get_setting('email_to') or '',
-        'check_interval': get_setting('check_interval') or '60'
+        'email_enabled': stored.get('email_enabled'),
+        'email_from': stored.get('email_from') or '',
+        'email_password': stored.get('email_password') or '',
+        'email_to': stored.get('email_to') or '',
+        'check_interval': stored.get('check_interval') or '60'
     }
     
-    return render_template_string(SETTINGS_TEMPLATE, settings=settings_data, message=None)
+    return render_template(SETTINGS_PAGE, settings=settings_data, message=None,
+                                  profile_runs=profiler.remaining(), profiles=profiler.list_profiles())
 
 @app.route('/save-settings', methods=['POST'])
 def save_settings():
-    set_setting('email_enabled', '1' if request.form.get('email_enabled') else '0')
-    set_setting('email_from', request.form.get('email_from', ''))
-    set_setting('email_password', request.form.get('email_password', ''))
-    set_setting('email_to', request.form.get('email_to', ''))
-    set_setting('check_interval', request.form.get('check_interval', '60'))
+    set_settings({
+        'email_enabled': '1' if request.form.get('email_enabled') else '0',
+        'email_from': request.form.get('email_from', ''),
+        'email_password': request.form.get('email_password', ''),
+        'email_to': request.form.get('email_to', ''),
+        'check_interval': request.form.get('check_interval', '60')
+    })
+    # Reload from the database so the page shows exactly what was stored
+    invalidate_settings()
+    stored = get_settings()
     
-    # Restart scheduler with new interval
-    interval = int(get_setting('check_interval'))
-    scheduler.remove_all_jobs()
-    scheduler.add_job(check_for_new_properties, 'interval', minutes=interval, id='property_check')
+    # The check interval sets the polling budget; spread it over the searches again
+    reschedule_searches(int(stored['check_interval']))
     
     settings_data = {
-        'email_enabled': get_setting('email_enabled'),
-        'email_from': get_setting('email_from'),
-        'email_password': get_setting('email_password'),
-        'email_to': get_setting('email_to'),
-        'check_interval': get_setting('check_interval')
+        'email_enabled': stored['email_enabled'],
+        'email_from': stored['email_from'],
+        'email_password': stored['email_password'],
+        'email_to': stored['email_to'],
+        'check_interval': stored['check_interval']
     }
     
-    return render_template_string(SETTINGS_TEMPLATE, settings=settings_data, 
-                                 message='Instellingen succesvol opgeslagen!')
+    return render_template(SETTINGS_PAGE, settings=settings_data, 
+                                 message='Instellingen succesvol opgeslagen!',
+                                 profile_runs=profiler.remaining(), profiles=profiler.list_profiles())
 
-@app.route('/run-check')
+@app.route('/admin/profiles', methods=['GET', 'POST'])
+def admin_profiles():
+    if request.method == 'POST':
+        profiler.arm(request.form.get('runs', 0, type=int))
+        view_cache.invalidate()
+        return redirect(url_for('settings'))
+    return jsonify({'armed_runs': profiler.remaining(), 'profiles': profiler.list_profiles()})
+
+@app.route('/admin/profiles/<int:profile_id>')
+def admin_profile(profile_id):
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        abort(404)
+    # Collapsed stacks; feed to flamegraph.pl or open in speedscope
+    return Response(profile['stacks'], mimetype='text/plain',
+                    headers={'Content-Disposition': f'inline; filename="profile-{profile_id}.folded"'})
+
+@app.route('/run-check', methods=['POST'])
 def run_check():
-    count = check_for_new_properties()
-    return redirect(url_for('dashboard'))
+    # Queue the check on the scheduler's thread pool so the request returns straight away;
+    # repeated clicks get the job that is already waiting or running
+    job_id, created = runs.queue_run('manual')
+    if created:
+        scheduler.add_job(check_for_new_properties, kwargs={'run_id': job_id}, id=f'manual_check_{job_id}',
+                          misfire_grace_time=None)
+    if request.accept_mimetypes.best == 'application/json' or request.args.get('format') == 'json':
+        return jsonify({'job_id': job_id,
+                        'status_url': url_for('job_status', job_id=job_id),
+                        'events_url': url_for('job_events', job_id=job_id)}), 202
+    return redirect(url_for('dashboard', job=job_id))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Table-backed gauges are read at scrape time; everything else is recorded as it happens
+    counters = dict(db.query("SELECT name, value FROM counters"))
+    metrics.set_gauge('immoweb_properties', counters.get('properties_total', 0), state='total')
+    metrics.set_gauge('immoweb_properties', counters.get('properties_unnotified', 0), state='unnotified')
+    metrics.set_gauge('immoweb_searches_active', counters.get('searches_active', 0))
+    for sink in NOTIFICATION_SINKS:
+        metrics.set_gauge('immoweb_outbox_pending', counters.get(f'outbox_pending:{sink.name}', 0), channel=sink.name)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    status = runs.run_status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+@app.route('/jobs/<int:job_id>/events')
+def job_events(job_id):
+    """Server-sent events with the job status each time it changes, until the run is finished"""
+    if runs.run_status(job_id) is None:
+        abort(404)
+    
+    def generate():
+        last = None
+        last_sent = time.time()
+        while True:
+            status = runs.run_status(job_id)
+            if status['status'] == 'queued':
+                runs.expire_queued()
+                status = runs.run_status(job_id)
+            if status != last:
+                last = status
+                last_sent = time.time()
+                yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+                if status['status'] in runs.FINAL_STATUSES:
+                    yield f"event: done\ndata: {json.dumps(status)}\n\n"
+                    return
+            if status['status'] == 'running' and not runs.lease_active():
+                # Its process died; the run is resumed by the next check, which this stream need not wait for
+                yield f"event: done\ndata: {json.dumps(status)}\n\n"
+                return
+            elif time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+            # Woken early by runs in this process; the timeout covers runs in other workers
+            with _run_progress:
+                _run_progress.wait(timeout=1)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Initialize scheduler
 scheduler = BackgroundScheduler()
 interval = int(get_setting('check_interval') or 60)
-scheduler.add_job(check_for_new_properties, 'interval', minutes=interval, id='property_check')
+# Each search is polled on its own adaptive interval; the tick only looks for searches that are due
+scheduler.add_job(scheduled_check, 'interval', seconds=Config.SCHEDULER_TICK, id='property_check',
+                  max_instances=1, coalesce=True)
 scheduler.start()
+profiler.arm(Config.PROFILE_RUNS)
+
+notifiers = [notifications.NotificationWorker(sink) for sink in NOTIFICATION_SINKS]
+for notifier in notifiers:
+    notifier.start()
 
 if __name__ == '__main__':
     print("🏠 Immoweb Prospectie Tool gestart!")
@@ -0,0 +1,143 @@
+"""In-process metrics for the scrape pipeline, exposed in Prometheus text format
+
+span('fetch') etc. observe the elapsed time in a per-stage latency histogram;
+inc() and set_gauge() maintain labelled counters and gauges. Recording is a
+perf_counter call, a bisect and a dict update under one lock, cheap enough
+to leave on permanently. The offline benchmark reads the stage totals via
+snapshot(); /metrics serves render(). Values are per process.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_METRIC = 'immoweb_stage_duration_seconds'
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# From first sighting to delivery spans seconds (worker woken by the scrape) to hours (sink down)
+NOTIFY_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+HELP = {
+    STAGE_METRIC: 'Time spent per pipeline stage',
+    'immoweb_pages_fetched_total': 'Search result pages requested, by HTTP status',
+    'immoweb_listings_parsed_total': 'Listings extracted from result pages',
+    'immoweb_listings_total': 'Listings offered to a search, by result (new or duplicate)',
+    'immoweb_parse_errors_total': 'Listings that could not be extracted',
+    'immoweb_price_drops_total': 'Known listings whose price went down',
+    'immoweb_notifications_total': 'Properties handed to a notification sink, by result',
+    'immoweb_check_runs_total': 'Check cycles run, by mode',
+    'immoweb_search_last_run_timestamp_seconds': 'When a search last finished',
+    'immoweb_search_last_run_duration_seconds': 'How long the last run of a search (its fetch group) took',
+    'immoweb_search_last_new_properties': 'New properties found by the last run of a search',
+    'immoweb_properties': 'Stored properties, by state',
+    'immoweb_searches_active': 'Active saved searches',
+    'immoweb_outbox_pending': 'Notifications waiting for delivery, by channel',
+    'immoweb_page_cache_total': 'HTML page requests, by cache result (hit or miss)',
+    'immoweb_time_to_notify_seconds': 'Time from first sighting to delivery of new properties, by channel',
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, buckets=BUCKETS, **labels):
+    """Observe one value in a labelled histogram; the buckets are fixed by the first observation"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0, 0.0, buckets]
+        histogram[0][bisect.bisect_left(histogram[3], value)] += 1
+        histogram[1] += 1
+        histogram[2] += value
+
+
+def record(stage, seconds):
+    """Observe one duration in the stage histogram"""
+    observe(STAGE_METRIC, seconds, stage=stage)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def remove_gauges(**labels):
+    """Drop the gauge series carrying all of these labels, e.g. those of a deleted search"""
+    wanted = set(labels.items())
+    with _lock:
+        for key in [key for key in _gauges if wanted <= set(key[1])]:
+            del _gauges[key]
+
+
+def snapshot():
+    """Map stage name -> {'count', 'seconds'}"""
+    with _lock:
+        return {dict(labels)['stage']: {'count': count, 'seconds': total}
+                for (name, labels), (_, count, total, _) in _histograms.items() if name == STAGE_METRIC}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _header(lines, seen, name, kind):
+    if name not in seen:
+        seen.add(name)
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        histograms = sorted((key, [list(value[0]), value[1], value[2], value[3]]) for key, value in _histograms.items())
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+    lines = []
+    seen = set()
+    for (name, labels), (buckets, count, total, bounds) in histograms:
+        _header(lines, seen, name, 'histogram')
+        cumulative = 0
+        for bound, bucket_count in zip(bounds, buckets):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for kind, items in (('counter', counters), ('gauge', gauges)):
+        for (name, labels), value in items:
+            _header(lines, seen, name, kind)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,376 @@
+"""Schema migrations, tracked with SQLite's PRAGMA user_version"""
+import hashlib
+import logging
+
+import db
+from parsers import CLASSIFIED_RE, parse_price
+
+logger = logging.getLogger(__name__)
+
+
+def initial_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS properties
+                 (id TEXT PRIMARY KEY,
+                  url TEXT,
+                  title TEXT,
+                  price TEXT,
+                  location TEXT,
+                  seller_type TEXT,
+                  first_seen TIMESTAMP,
+                  notified INTEGER DEFAULT 0)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS search_configs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT,
+                  province TEXT,
+                  property_type TEXT,
+                  min_price INTEGER,
+                  max_price INTEGER,
+                  seller_type TEXT,
+                  active INTEGER DEFAULT 1)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS settings
+                 (key TEXT PRIMARY KEY,
+                  value TEXT)''')
+
+    # Insert default settings if not exist
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_enabled', '0')")
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_from', '')")
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_password', '')")
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('email_to', '')")
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('check_interval', '60')")
+    c.execute("INSERT OR IGNORE INTO settings VALUES ('last_check', '')")
+
+
+def integer_timestamps_and_indexes(c):
+    # first_seen was written as local 'YYYY-MM-DD HH:MM:SS' text; store unix seconds instead
+    c.execute("""UPDATE properties
+                 SET first_seen = CAST(strftime('%s', first_seen, 'utc') AS INTEGER)
+                 WHERE typeof(first_seen) = 'text'""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_properties_first_seen ON properties (first_seen, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_properties_unnotified ON properties (id) WHERE notified = 0")
+
+
+def maintained_counters(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS counters
+                 (name TEXT PRIMARY KEY,
+                  value INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("INSERT OR REPLACE INTO counters SELECT 'properties_total', COUNT(*) FROM properties")
+    c.execute("INSERT OR REPLACE INTO counters SELECT 'properties_unnotified', COUNT(*) FROM properties WHERE notified = 0")
+    c.execute("INSERT OR REPLACE INTO counters SELECT 'searches_active', COUNT(*) FROM search_configs WHERE active = 1")
+
+    c.execute('''CREATE TRIGGER IF NOT EXISTS properties_count_insert AFTER INSERT ON properties BEGIN
+                     UPDATE counters SET value = value + 1 WHERE name = 'properties_total';
+                     UPDATE counters SET value = value + (NEW.notified = 0) WHERE name = 'properties_unnotified';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS properties_count_delete AFTER DELETE ON properties BEGIN
+                     UPDATE counters SET value = value - 1 WHERE name = 'properties_total';
+                     UPDATE counters SET value = value - (OLD.notified = 0) WHERE name = 'properties_unnotified';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS properties_count_notified AFTER UPDATE OF notified ON properties BEGIN
+                     UPDATE counters SET value = value + (NEW.notified = 0) - (OLD.notified = 0)
+                     WHERE name = 'properties_unnotified';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS searches_count_insert AFTER INSERT ON search_configs BEGIN
+                     UPDATE counters SET value = value + (NEW.active = 1) WHERE name = 'searches_active';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS searches_count_delete AFTER DELETE ON search_configs BEGIN
+                     UPDATE counters SET value = value - (OLD.active = 1) WHERE name = 'searches_active';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS searches_count_active AFTER UPDATE OF active ON search_configs BEGIN
+                     UPDATE counters SET value = value + (NEW.active = 1) - (OLD.active = 1)
+                     WHERE name = 'searches_active';
+                 END''')
+
+
+def numeric_price(c):
+    c.execute("ALTER TABLE properties ADD COLUMN price_value INTEGER")
+    rows = c.execute("SELECT id, price FROM properties").fetchall()
+    c.executemany("UPDATE properties SET price_value = ? WHERE id = ?",
+                  [(parse_price(row[1]), row[0]) for row in rows])
+
+
+def structured_listing_fields(c):
+    c.execute("ALTER TABLE properties ADD COLUMN listing_id INTEGER")
+    c.execute("ALTER TABLE properties ADD COLUMN postal_code TEXT")
+    c.execute("ALTER TABLE properties ADD COLUMN bedrooms INTEGER")
+    c.execute("ALTER TABLE properties ADD COLUMN surface INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_properties_postal_code ON properties (postal_code, first_seen)")
+
+
+def adaptive_schedule(c):
+    c.execute("ALTER TABLE search_configs ADD COLUMN velocity REAL")
+    c.execute("ALTER TABLE search_configs ADD COLUMN poll_interval REAL")
+    c.execute("ALTER TABLE search_configs ADD COLUMN last_checked INTEGER")
+    c.execute("ALTER TABLE search_configs ADD COLUMN next_check INTEGER")
+
+
+def check_run_journal(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS check_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  mode TEXT,
+                  status TEXT,
+                  started_at INTEGER,
+                  finished_at INTEGER,
+                  new_count INTEGER,
+                  resumed INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS check_run_searches
+                 (run_id INTEGER REFERENCES check_runs (id) ON DELETE CASCADE,
+                  search_id INTEGER,
+                  status TEXT,
+                  new_count INTEGER,
+                  started_at REAL,
+                  finished_at REAL,
+                  PRIMARY KEY (run_id, search_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_check_runs_status ON check_runs (status)")
+    c.execute('''CREATE TABLE IF NOT EXISTS run_locks
+                 (name TEXT PRIMARY KEY,
+                  owner TEXT,
+                  expires_at INTEGER)''')
+
+
+def notification_outbox(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS notification_outbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  property_id TEXT NOT NULL REFERENCES properties (id) ON DELETE CASCADE,
+                  channel TEXT NOT NULL DEFAULT 'email',
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt INTEGER NOT NULL DEFAULT 0,
+                  lease_until INTEGER,
+                  last_error TEXT,
+                  created_at INTEGER,
+                  sent_at INTEGER,
+                  UNIQUE (property_id, channel))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (channel, status, next_attempt)")
+    # Anything stored but not yet notified is still owed a notification
+    c.execute("""INSERT OR IGNORE INTO notification_outbox (property_id, channel, created_at)
+                 SELECT id, 'email', first_seen FROM properties WHERE notified = 0""")
+
+
+def notification_rules(c):
+    c.execute("ALTER TABLE properties ADD COLUMN search_id INTEGER")
+    c.execute('''CREATE TABLE IF NOT EXISTS notification_rules
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT,
+                  search_id INTEGER REFERENCES search_configs (id) ON DELETE CASCADE,
+                  recipients TEXT,
+                  include_keywords TEXT,
+                  exclude_keywords TEXT,
+                  min_price INTEGER,
+                  max_price INTEGER,
+                  max_price_per_m2 INTEGER,
+                  min_bedrooms INTEGER,
+                  seller_type TEXT,
+                  active INTEGER DEFAULT 1)''')
+
+
+def price_history(c):
+    c.execute("ALTER TABLE properties ADD COLUMN content_hash INTEGER")
+    c.execute('''CREATE TABLE IF NOT EXISTS property_snapshots
+                 (property_id TEXT NOT NULL REFERENCES properties (id) ON DELETE CASCADE,
+                  version INTEGER NOT NULL,
+                  content_hash INTEGER NOT NULL,
+                  price_value INTEGER,
+                  price_delta INTEGER,
+                  seen_at INTEGER,
+                  PRIMARY KEY (property_id, version)) WITHOUT ROWID''')
+    # Outbox rows now belong to a property version (1 = first seen), so the unique key changes; rebuild the table
+    c.execute('''CREATE TABLE notification_outbox_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  property_id TEXT NOT NULL REFERENCES properties (id) ON DELETE CASCADE,
+                  channel TEXT NOT NULL DEFAULT 'email',
+                  event TEXT NOT NULL DEFAULT 'new',
+                  version INTEGER NOT NULL DEFAULT 1,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt INTEGER NOT NULL DEFAULT 0,
+                  lease_until INTEGER,
+                  last_error TEXT,
+                  created_at INTEGER,
+                  sent_at INTEGER,
+                  UNIQUE (property_id, channel, version))''')
+    c.execute("""INSERT INTO notification_outbox_new
+                 (id, property_id, channel, status, attempts, next_attempt, lease_until, last_error, created_at, sent_at)
+                 SELECT id, property_id, channel, status, attempts, next_attempt, lease_until, last_error,
+                        created_at, sent_at
+                 FROM notification_outbox""")
+    c.execute("DROP TABLE notification_outbox")
+    c.execute("ALTER TABLE notification_outbox_new RENAME TO notification_outbox")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (channel, status, next_attempt)")
+
+
+def cycle_profiles(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS profiles
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  started_at INTEGER,
+                  seconds REAL,
+                  samples INTEGER,
+                  interval_ms INTEGER,
+                  new_count INTEGER,
+                  stacks TEXT)''')
+
+
+def property_sequence(c):
+    # Monotonic insert sequence for API polling; rowids of a TEXT-keyed table can be reused or renumbered by VACUUM
+    c.execute("ALTER TABLE properties ADD COLUMN seq INTEGER")
+    rows = c.execute("SELECT id FROM properties ORDER BY first_seen, rowid").fetchall()
+    c.executemany("UPDATE properties SET seq = ? WHERE id = ?",
+                  [(number, row[0]) for number, row in enumerate(rows, start=1)])
+    c.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('properties_seq', ?)", (len(rows),))
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_properties_seq ON properties (seq)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS properties_seq_insert AFTER INSERT ON properties BEGIN
+                     UPDATE counters SET value = value + 1 WHERE name = 'properties_seq';
+                     UPDATE properties SET seq = (SELECT value FROM counters WHERE name = 'properties_seq')
+                     WHERE rowid = NEW.rowid;
+                 END''')
+
+
+def outbox_recipients(c):
+    # Email rows are fanned out to one row per routed recipient, so recipient joins the unique key; rebuild
+    c.execute('''CREATE TABLE notification_outbox_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  property_id TEXT NOT NULL REFERENCES properties (id) ON DELETE CASCADE,
+                  channel TEXT NOT NULL DEFAULT 'email',
+                  recipient TEXT NOT NULL DEFAULT '',
+                  event TEXT NOT NULL DEFAULT 'new',
+                  version INTEGER NOT NULL DEFAULT 1,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt INTEGER NOT NULL DEFAULT 0,
+                  lease_until INTEGER,
+                  last_error TEXT,
+                  created_at INTEGER,
+                  sent_at INTEGER,
+                  UNIQUE (property_id, channel, version, recipient))''')
+    c.execute("""INSERT INTO notification_outbox_new
+                 (id, property_id, channel, event, version, status, attempts, next_attempt, lease_until, last_error,
+                  created_at, sent_at)
+                 SELECT id, property_id, channel, event, version, status, attempts, next_attempt, lease_until,
+                        last_error, created_at, sent_at
+                 FROM notification_outbox""")
+    c.execute("DROP TABLE notification_outbox")
+    c.execute("ALTER TABLE notification_outbox_new RENAME TO notification_outbox")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (channel, status, next_attempt)")
+
+
+def listing_id_keys(c):
+    # Properties were keyed on md5(url), and the JSON and DOM extraction build different URLs for one listing
+    for row in c.execute("SELECT id, url FROM properties WHERE listing_id IS NULL").fetchall():
+        match = CLASSIFIED_RE.search(row[1] or '')
+        if match:
+            c.execute("UPDATE properties SET listing_id = ? WHERE id = ?", (int(match.group(2)), row[0]))
+    # Keep the first sighting of listings stored twice; snapshots and outbox rows cascade
+    c.execute("""DELETE FROM properties WHERE listing_id IS NOT NULL AND seq NOT IN
+                 (SELECT MIN(seq) FROM properties WHERE listing_id IS NOT NULL GROUP BY listing_id)""")
+    # The child tables are re-pointed below, before the commit checks the references
+    c.execute("PRAGMA defer_foreign_keys = ON")
+    renames = [(hashlib.md5(f"immoweb:{row[1]}".encode()).hexdigest(), row[0])
+               for row in c.execute("SELECT id, listing_id FROM properties WHERE listing_id IS NOT NULL")]
+    for table, column in (('properties', 'id'), ('property_snapshots', 'property_id'),
+                          ('notification_outbox', 'property_id')):
+        c.executemany(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", renames)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_properties_listing_id ON properties (listing_id) "
+              "WHERE listing_id IS NOT NULL")
+    # DOM extraction used to store the searched province as location
+    c.execute("UPDATE properties SET location = NULL WHERE location IN (SELECT province FROM search_configs)")
+
+
+def price_cents(c):
+    # parse_price read "€ 250.000,00" as 25000000; re-parse the price texts that carry cents
+    rows = c.execute("SELECT id, price FROM properties WHERE price LIKE '%,__' OR price LIKE '%.__'").fetchall()
+    c.executemany("UPDATE properties SET price_value = ? WHERE id = ?",
+                  [(parse_price(row[1]), row[0]) for row in rows])
+
+
+def outbox_pending_counters(c):
+    # /metrics reads pending outbox rows per channel from counters instead of counting on every scrape
+    c.execute("""INSERT OR REPLACE INTO counters
+                 SELECT 'outbox_pending:' || channel, COUNT(*) FROM notification_outbox
+                 WHERE status IN ('pending', 'sending') GROUP BY channel""")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS outbox_count_insert AFTER INSERT ON notification_outbox BEGIN
+                     INSERT OR IGNORE INTO counters (name, value) VALUES ('outbox_pending:' || NEW.channel, 0);
+                     UPDATE counters SET value = value + (NEW.status IN ('pending', 'sending'))
+                     WHERE name = 'outbox_pending:' || NEW.channel;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS outbox_count_delete AFTER DELETE ON notification_outbox BEGIN
+                     UPDATE counters SET value = value - (OLD.status IN ('pending', 'sending'))
+                     WHERE name = 'outbox_pending:' || OLD.channel;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS outbox_count_status AFTER UPDATE OF status ON notification_outbox BEGIN
+                     UPDATE counters SET value = value + (NEW.status IN ('pending', 'sending'))
+                                                       - (OLD.status IN ('pending', 'sending'))
+                     WHERE name = 'outbox_pending:' || NEW.channel;
+                 END''')
+
+
+def backfill_first_seen(c):
+    # Texts strftime could not parse became NULL in integer_timestamps_and_indexes; keyset paging needs a value.
+    # They sort as the oldest rows.
+    c.execute("""UPDATE properties SET first_seen = COALESCE((SELECT MIN(first_seen) FROM properties), 0)
+                 WHERE first_seen IS NULL""")
+
+
+def default_rule(c):
+    # With rules, unmatched properties go nowhere; an explicit catch-all keeps the default recipients informed
+    c.execute("""INSERT INTO notification_rules (name, recipients, seller_type, active)
+                 VALUES ('Alle panden', '', 'all', 1)""")
+
+
+def _version_counter(c, table, name):
+    c.execute("INSERT OR REPLACE INTO counters (name, value) VALUES (?, 0)", (name,))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                         UPDATE counters SET value = value + 1 WHERE name = '{name}';
+                     END''')
+
+
+def settings_version(c):
+    # Settings are cached per process; a version bumped by triggers tells every process to reload
+    _version_counter(c, 'settings', 'settings_version')
+
+
+def rules_version(c):
+    # Same for the compiled rule engine: the worker delivering email may not be the one that edited the rules
+    _version_counter(c, 'notification_rules', 'rules_version')
+
+
+def search_recrawl_time(c):
+    # When each search last read all its pages; kept in memory it was lost on every restart and per worker
+    c.execute("ALTER TABLE search_configs ADD COLUMN last_recrawl INTEGER")
+
+
+# Append new migrations to the end; never reorder or edit applied ones
+MIGRATIONS = [
+    initial_schema,
+    integer_timestamps_and_indexes,
+    maintained_counters,
+    numeric_price,
+    structured_listing_fields,
+    adaptive_schedule,
+    check_run_journal,
+    notification_outbox,
+    notification_rules,
+    price_history,
+    cycle_profiles,
+    property_sequence,
+    outbox_recipients,
+    listing_id_keys,
+    price_cents,
+    outbox_pending_counters,
+    backfill_first_seen,
+    default_rule,
+    settings_version,
+    rules_version,
+    search_recrawl_time,
+]
+
+
+def migrate():
+    """Apply all pending migrations in a single transaction"""
+    with db.transaction(immediate=True) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {number}")
+            logger.info("Applied migration %d: %s", number, migration.__name__)
@@ -0,0 +1,377 @@
+"""Notification outbox and the worker that delivers it
+
+New properties get an outbox row in the same transaction that stores them.
+A background worker claims pending rows in batches, sends one digest per
+batch and only then marks the properties notified, so a slow or failing mail
+server never holds up a check run and nothing is lost if delivery fails.
+Failed batches are retried with exponential backoff.
+
+Each sink (see sinks.py) is its own outbox channel with its own worker and
+circuit breaker, so new properties fan out to all sinks concurrently. A sink
+with recipients (email) routes its rows first: each is replaced by one row
+per recipient, and every recipient's digest is completed or retried on its
+own, so one bad address never makes the others receive a digest twice.
+"""
+import logging
+import smtplib
+import threading
+import time
+
+from jinja2 import Environment
+
+import db
+import metrics
+import view_cache
+from config import Config
+from parsers import format_price
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_EMAIL = 'email'
+# A claimed batch that is not completed within this many seconds is claimed again
+CLAIM_TTL = 600
+
+_templates = Environment(autoescape=True)
+_templates.filters['euro'] = format_price
+DIGEST_TEMPLATE = _templates.from_string('''<html><body style="font-family: Arial, sans-serif;">
+<h2>{{ subject }}</h2>
+{% for prop in properties %}
+<div style="border: 1px solid #ddd; padding: 15px; margin: 10px 0; border-radius: 8px;">
+    <h3>{{ prop.title }}</h3>
+    {% if prop.event == 'price_drop' %}
+    <p><strong>Prijsdaling:</strong> {{ prop.previous_price_value|euro }} → {{ prop.snapshot_price_value|euro }} ({{ prop.price_delta|euro }})</p>
+    {% else %}
+    <p><strong>Prijs:</strong> {{ prop.price }}</p>
+    {% endif %}
+    {% if prop.location %}<p><strong>Locatie:</strong> {{ prop.location }}</p>{% endif %}
+    <p><strong>Type verkoper:</strong> {{ prop.seller_type }}</p>
+    <a href="{{ prop.url }}" style="display: inline-block; padding: 10px 20px; background: #667eea; color: white; text-decoration: none; border-radius: 5px;">Bekijk pand</a>
+</div>
+{% endfor %}
+</body></html>''')
+
+
+def digest_subject(properties):
+    drops = sum(1 for prop in properties if prop.get('event') == 'price_drop')
+    parts = []
+    if len(properties) > drops:
+        parts.append(f"{len(properties) - drops} nieuwe panden")
+    if drops:
+        parts.append(f"{drops} prijsdalingen")
+    return f"🏠 {' en '.join(parts)} gevonden op Immoweb"
+
+
+def render_digest(properties):
+    return DIGEST_TEMPLATE.render(properties=properties, subject=digest_subject(properties))
+
+
+def enqueue(conn, entries, channels=(CHANNEL_EMAIL,), event='new'):
+    """
+    Add outbox rows per channel for (property id, version) entries
+
+    Call inside the transaction that writes the properties or their new version.
+    """
+    now = int(time.time())
+    conn.executemany("""INSERT OR IGNORE INTO notification_outbox (property_id, channel, event, version, created_at)
+                        VALUES (?, ?, ?, ?, ?)""",
+                     [(property_id, channel, event, version, now)
+                      for property_id, version in entries for channel in channels])
+
+
+def claim(channel=CHANNEL_EMAIL, limit=None):
+    """Claim up to limit due outbox rows; returns property dicts with their outbox id"""
+    limit = limit or Config.NOTIFY_BATCH_SIZE
+    now = int(time.time())
+    with db.transaction(immediate=True) as conn:
+        # Two seeks on idx_outbox_due; an OR of both would scan the channel's whole history
+        rows = conn.execute("""SELECT o.id AS outbox_id, o.attempts, o.event, o.recipient, p.*,
+                                      s.price_value AS snapshot_price_value, s.price_delta,
+                                      s.price_value - s.price_delta AS previous_price_value
+                               FROM (SELECT id FROM notification_outbox
+                                     WHERE channel = ? AND status = 'pending' AND next_attempt <= ?
+                                     UNION ALL
+                                     SELECT id FROM notification_outbox
+                                     WHERE channel = ? AND status = 'sending' AND lease_until < ?
+                                     ORDER BY id LIMIT ?) due
+                               JOIN notification_outbox o ON o.id = due.id
+                               JOIN properties p ON p.id = o.property_id
+                               LEFT JOIN property_snapshots s ON s.property_id = o.property_id AND s.version = o.version
+                               ORDER BY o.id""", (channel, now, channel, now, limit)).fetchall()
+        conn.executemany("UPDATE notification_outbox SET status = 'sending', lease_until = ? WHERE id = ?",
+                         [(now + CLAIM_TTL, row['outbox_id']) for row in rows])
+    return [dict(row) for row in rows]
+
+
+def fan_out(batch, routes):
+    """Replace claimed unrouted rows by one pending row per recipient; routes maps recipient -> properties"""
+    now = int(time.time())
+    with db.transaction() as conn:
+        conn.executemany("""INSERT OR IGNORE INTO notification_outbox
+                            (property_id, channel, recipient, event, version, created_at)
+                            SELECT property_id, channel, ?, event, version, ? FROM notification_outbox WHERE id = ?""",
+                         [(recipient, now, prop['outbox_id'])
+                          for recipient, properties in routes.items() for prop in properties])
+        conn.executemany("UPDATE notification_outbox SET status = 'routed', sent_at = ?, lease_until = NULL WHERE id = ?",
+                         [(now, prop['outbox_id']) for prop in batch])
+
+
+def prune(channel, days=None):
+    """Delete finished rows of a channel older than OUTBOX_KEEP_DAYS; returns how many"""
+    days = Config.OUTBOX_KEEP_DAYS if days is None else days
+    cutoff = int(time.time()) - days * 86400
+    with db.transaction() as conn:
+        c = conn.execute("""DELETE FROM notification_outbox
+                            WHERE channel = ? AND status NOT IN ('pending', 'sending')
+                            AND COALESCE(sent_at, created_at, 0) < ?""", (channel, cutoff))
+    return c.rowcount
+
+
+def release(batch):
+    """Hand claimed rows back untouched, e.g. when the circuit opened before they were tried"""
+    with db.transaction() as conn:
+        conn.executemany("UPDATE notification_outbox SET status = 'pending', lease_until = NULL WHERE id = ?",
+                         [(prop['outbox_id'],) for prop in batch])
+
+
+def complete(batch, status='sent'):
+    """
+    Record delivery of a claimed batch
+
+    A property counts as notified once any channel actually delivered it;
+    'skipped' rows (e.g. no notification rule matched) leave it unnotified.
+    """
+    now = int(time.time())
+    with db.transaction() as conn:
+        conn.executemany("UPDATE notification_outbox SET status = ?, sent_at = ?, lease_until = NULL WHERE id = ?",
+                         [(status, now, prop['outbox_id']) for prop in batch])
+        if status == 'sent':
+            conn.executemany("UPDATE properties SET notified = 1 WHERE id = ? AND notified = 0",
+                             [(prop['id'],) for prop in batch])
+    view_cache.invalidate()
+
+
+def fail(batch, error):
+    """Put a claimed batch back with exponential backoff, or give up after NOTIFY_MAX_ATTEMPTS"""
+    now = int(time.time())
+    updates = []
+    for prop in batch:
+        attempts = prop['attempts'] + 1
+        status = 'failed' if attempts >= Config.NOTIFY_MAX_ATTEMPTS else 'pending'
+        delay = min(Config.NOTIFY_RETRY_BASE * 2 ** (attempts - 1), 3600)
+        updates.append((status, attempts, now + delay, str(error)[:500], prop['outbox_id']))
+    with db.transaction() as conn:
+        conn.executemany("""UPDATE notification_outbox
+                            SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, lease_until = NULL
+                            WHERE id = ?""", updates)
+
+
+def abandon_channels(configured):
+    """Give up rows still waiting on channels whose sink is no longer configured; returns how many"""
+    placeholders = ','.join('?' * len(configured))
+    with db.transaction() as conn:
+        c = conn.execute(f"""UPDATE notification_outbox SET status = 'abandoned', lease_until = NULL
+                             WHERE status IN ('pending', 'sending') AND channel NOT IN ({placeholders})""",
+                         list(configured))
+    return c.rowcount
+
+
+class SmtpMailer:
+    """Keeps one SMTP connection open between digests and reconnects when it drops"""
+
+    def __init__(self, host=None, port=None, timeout=None):
+        self.host = host or Config.SMTP_SERVER
+        self.port = port or Config.SMTP_PORT
+        self.timeout = timeout or Config.SMTP_TIMEOUT
+        self.server = None
+        self.credentials = None
+        self.last_used = 0
+        self.lock = threading.Lock()
+
+    def _connect(self, username, password):
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            server.starttls()
+        server.login(username, password)
+        self.server = server
+        self.credentials = (username, password)
+
+    def send(self, msg, username, password):
+        with self.lock:
+            if self.credentials != (username, password):
+                self._close()
+            for attempt in range(2):
+                if self.server is None:
+                    self._connect(username, password)
+                try:
+                    self.server.send_message(msg)
+                    self.last_used = time.time()
+                    return
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    # The server may have dropped an idle connection; retry once on a fresh one
+                    self._close()
+                    if attempt:
+                        raise
+
+    def close_idle(self, idle_seconds=None):
+        idle_seconds = Config.SMTP_IDLE_TIMEOUT if idle_seconds is None else idle_seconds
+        with self.lock:
+            if self.server is not None and time.time() - self.last_used > idle_seconds:
+                self._close()
+
+    def _close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.server = None
+        self.credentials = None
+
+
+class CircuitBreaker:
+    """Stops calling a sink after repeated failures and lets one trial through after a cooldown"""
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or Config.SINK_FAILURE_THRESHOLD
+        self.cooldown = cooldown or Config.SINK_COOLDOWN
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        return self.state != 'open'
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class NotificationWorker(threading.Thread):
+    """
+    Background thread that drains the outbox of one sink
+
+    sink.send(properties) delivers one batch and returns True, returns False
+    when the sink is switched off (the batch is skipped, so switching it on
+    later does not flush a backlog) and raises when delivery fails (the batch
+    is retried later). A sink with a route(properties) method gets
+    single-recipient batches (see fan_out).
+    """
+
+    def __init__(self, sink):
+        super().__init__(name=f'notify-{sink.name}', daemon=True)
+        self.sink = sink
+        self.channel = sink.name
+        self.deliver = sink.send
+        self.pruned_at = float('-inf')
+        self.route = getattr(sink, 'route', None)
+        self.on_idle = sink.on_idle
+        self.breaker = CircuitBreaker()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(Config.NOTIFY_POLL_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.drain()
+                if time.monotonic() - self.pruned_at > 3600:
+                    self.pruned_at = time.monotonic()
+                    prune(self.channel)
+            except Exception as e:
+                logger.exception("Notification worker error: %s", e)
+            if self.on_idle:
+                self.on_idle()
+
+    def drain(self):
+        """Deliver due outbox rows batch by batch; returns the number of properties delivered"""
+        delivered = 0
+        while not self.stopping.is_set():
+            if not self.breaker.allow():
+                break
+            batch = claim(self.channel)
+            if not batch:
+                break
+            if self.route:
+                unrouted = [prop for prop in batch if not prop['recipient']]
+                if unrouted:
+                    routes = self.route(unrouted)
+                    if routes is None:
+                        self.skip(batch)
+                        continue
+                    # Rows no rule routed anywhere are done, without counting as notified
+                    routed = {prop['outbox_id'] for properties in routes.values() for prop in properties}
+                    fan_out([prop for prop in unrouted if prop['outbox_id'] in routed], routes)
+                    unmatched = [prop for prop in unrouted if prop['outbox_id'] not in routed]
+                    self.skip(unmatched)
+                    batch = [prop for prop in batch if prop['recipient']]
+            groups = {}
+            for prop in batch:
+                groups.setdefault(prop['recipient'], []).append(prop)
+            groups = list(groups.values())
+            failed = False
+            for number, group in enumerate(groups):
+                if not self.breaker.allow():
+                    release([prop for rest in groups[number:] for prop in rest])
+                    return delivered
+                sent = self.deliver_group(group)
+                if sent is False:
+                    self.skip([prop for rest in groups[number + 1:] for prop in rest])
+                    break
+                failed = failed or sent is None
+                delivered += len(group) if sent else 0
+            if failed:
+                break
+        return delivered
+
+    def skip(self, batch):
+        """Complete rows nobody gets (switched off, or no rule matched) without counting them as notified"""
+        if batch:
+            complete(batch, 'skipped')
+            metrics.inc('immoweb_notifications_total', len(batch), channel=self.channel, result='skipped')
+
+    def deliver_group(self, batch):
+        """Deliver one single-recipient batch; returns True when sent, False when switched off, None on failure"""
+        try:
+            with metrics.span('notify'):
+                sent = self.deliver(batch)
+        except Exception as e:
+            logger.warning("Error sending %s notification for %d properties: %s", self.channel, len(batch), e)
+            fail(batch, e)
+            metrics.inc('immoweb_notifications_total', len(batch), channel=self.channel, result='failed')
+            self.breaker.record_failure()
+            if not self.breaker.allow():
+                logger.warning("Circuit open for %s; pausing for %ss", self.channel, self.breaker.cooldown)
+            return None
+        self.breaker.record_success()
+        if not sent:
+            self.skip(batch)
+            return False
+        complete(batch, 'sent')
+        metrics.inc('immoweb_notifications_total', len(batch), channel=self.channel, result='sent')
+        # Price drops are re-notifications of old listings, so only new ones count towards time-to-notify
+        now = time.time()
+        for prop in batch:
+            if prop['event'] == 'new' and prop['first_seen']:
+                metrics.observe('immoweb_time_to_notify_seconds', now - prop['first_seen'],
+                                metrics.NOTIFY_BUCKETS, channel=self.channel)
+        return True
@@ -0,0 +1,306 @@
+import html
+import io
+import json
+import logging
+import re
+import time
+import unicodedata
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import ijson
+    # The pure-Python ijson backends are slower than json.loads, so only stream with the C one
+    if ijson.backend not in ('yajl2_c', 'yajl2_cffi'):
+        ijson = None
+except ImportError:
+    ijson = None
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = 'https://www.immoweb.be'
+PRICE_RE = re.compile(r'\d[\d.,\s  ]*')
+CENTS_RE = re.compile(r'[.,]\d{2}$')
+# /en/classified/<type>/for-sale/<locality>/<postal code>/<listing id>
+CLASSIFIED_RE = re.compile(r'/classified/[^/]+/[^/]+/[^/]+/(\w+)/(\d+)')
+RESULTS_MARKERS = (b":results='", b':results="')
+
+
+def parse_price(text):
+    """Extract the first euro amount from a price string as an integer
+
+    Cents ("€ 250.000,00") are dropped. Returns None for 'Prijs op aanvraag'
+    and other texts without digits.
+    """
+    if not text:
+        return None
+    match = PRICE_RE.search(str(text))
+    if not match:
+        return None
+    digits = re.sub(r'\D', '', CENTS_RE.sub('', match.group(0).rstrip()))
+    return int(digits) if digits else None
+
+
+def make_listing(href, title, price, is_private):
+    url = href if href.startswith('http') else BASE_URL + href
+    match = CLASSIFIED_RE.search(url)
+    return {
+        'url': url,
+        'title': title or 'Geen titel',
+        'price': price or 'Prijs op aanvraag',
+        'price_value': parse_price(price),
+        'seller_type': 'Particulier' if is_private else 'Makelaar',
+        'location': None,
+        'listing_id': int(match.group(2)) if match else None,
+        'postal_code': match.group(1) if match else None,
+        'bedrooms': None,
+        'surface': None,
+    }
+
+
+def slugify(value):
+    value = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-')
+
+
+def format_price(value):
+    return f"€ {int(value):,}".replace(',', '.') if value else None
+
+
+def embedded_results(content):
+    """Return the raw JSON of the search results embedded in the page, or None
+
+    Immoweb renders results client-side from a <iw-search :results='[...]'>
+    attribute, so the payload can be cut out with a byte search instead of
+    building a DOM.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    for marker in RESULTS_MARKERS:
+        start = content.find(marker)
+        if start == -1:
+            continue
+        start += len(marker)
+        end = content.find(marker[-1:], start)
+        if end == -1:
+            return None
+        payload = content[start:end]
+        if b'&' in payload:
+            payload = html.unescape(payload.decode('utf-8')).encode('utf-8')
+        return payload
+    return None
+
+
+def iter_results(payload):
+    if ijson is not None:
+        return ijson.items(io.BytesIO(payload), 'item', use_float=True)
+    return iter(json.loads(payload))
+
+
+def map_result(result):
+    """Map one embedded search result onto a listing dict"""
+    prop = result.get('property') or {}
+    location = prop.get('location') or {}
+    transaction = result.get('transaction') or {}
+    price_value = (result.get('price') or {}).get('mainValue') \
+        or ((transaction.get('sale') or {}).get('price'))
+    customers = result.get('customers') or [{}]
+    subtype = (prop.get('subtype') or prop.get('type') or 'property').lower().replace('_', '-')
+    locality = location.get('locality') or ''
+    postal_code = location.get('postalCode')
+    bedrooms = prop.get('bedroomCount')
+    surface = prop.get('netHabitableSurface')
+
+    url = '/'.join([BASE_URL, 'en/classified', subtype,
+                    (transaction.get('type') or 'FOR_SALE').lower().replace('_', '-'),
+                    slugify(locality), str(postal_code), str(result['id'])])
+    title_parts = [subtype.replace('-', ' ').capitalize()]
+    if bedrooms:
+        title_parts.append(f"{bedrooms} slpk")
+    if surface:
+        title_parts.append(f"{surface} m²")
+    if locality:
+        title_parts.append(f"{postal_code} {locality}" if postal_code else locality)
+
+    return {
+        'url': url,
+        'title': ' - '.join(title_parts),
+        'price': format_price(price_value) or 'Prijs op aanvraag',
+        'price_value': int(price_value) if price_value else None,
+        'seller_type': 'Particulier' if customers[0].get('type') == 'PRIVATE' else 'Makelaar',
+        'location': locality or None,
+        'listing_id': int(result['id']),
+        'postal_code': str(postal_code) if postal_code else None,
+        'bedrooms': int(bedrooms) if bedrooms is not None else None,
+        'surface': int(surface) if surface is not None else None,
+    }
+
+
+class EmbeddedJsonParser:
+    """Reads listings from the page's embedded results payload, skipping the DOM"""
+
+    name = 'json'
+
+    def parse(self, content):
+        """Return listings, or None when the page carries no payload"""
+        payload = embedded_results(content)
+        if payload is None:
+            return None
+        listings = []
+        for result in iter_results(payload):
+            start = time.perf_counter()
+            try:
+                listings.append(map_result(result))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Error parsing listing: %s", e)
+                metrics.inc('immoweb_parse_errors_total', parser=self.name)
+            metrics.record('extract', time.perf_counter() - start)
+        return listings
+
+
+class SoupParser:
+    """Pure-Python fallback built on BeautifulSoup"""
+
+    name = 'bs4'
+    ARTICLES = SoupStrainer('article')
+
+    def _is_card(self, value):
+        return value and 'card' in value.lower()
+
+    def parse(self, content):
+        # Only build a tree for <article> elements; re-parse for card divs if there are none
+        soup = BeautifulSoup(content, 'html.parser', parse_only=self.ARTICLES)
+        elements = soup.find_all('article')
+        if not elements:
+            soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer('div', class_=self._is_card))
+            elements = soup.find_all('div', class_=self._is_card)
+
+        listings = []
+        for element in elements:
+            start = time.perf_counter()
+            try:
+                link_elem = element.find('a', href=True)
+                if not link_elem:
+                    continue
+                title_elem = element.find('h2') or element.find('h3') or element.find('a')
+                price_elem = element.find(string=lambda t: '€' in t)
+                listings.append(make_listing(
+                    link_elem['href'],
+                    title_elem.get_text(strip=True) if title_elem else None,
+                    price_elem.strip() if price_elem else None,
+                    'particulier' in element.get_text().lower()))
+            except Exception as e:
+                logger.warning("Error parsing listing: %s", e)
+                metrics.inc('immoweb_parse_errors_total', parser=self.name)
+            metrics.record('extract', time.perf_counter() - start)
+        return listings
+
+
+class LxmlParser:
+    """libxml2-backed parser with precompiled XPath selectors"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        self.articles = etree.XPath('//article')
+        self.cards = etree.XPath("//div[contains(translate(@class, 'CARD', 'card'), 'card')]")
+        self.link = etree.XPath('(.//a[@href])[1]/@href')
+        self.titles = [etree.XPath('(.//h2)[1]'), etree.XPath('(.//h3)[1]'), etree.XPath('(.//a)[1]')]
+        self.price = etree.XPath("(.//text()[contains(., '€')])[1]")
+        self.private = etree.XPath(
+            "contains(translate(string(.), 'PARTICULIER', 'particulier'), 'particulier')")
+        # Immoweb serves UTF-8; without this libxml2 assumes Latin-1 for bytes lacking a meta charset
+        self.html_parser = lxml_html.HTMLParser(encoding='utf-8')
+
+    @staticmethod
+    def results_slice(content):
+        """The markup from the first <article> to the end of the last one, or None
+
+        Like the SoupStrainer of the bs4 path, this keeps libxml2 from building
+        the page chrome around the results.
+        """
+        marker, closing = ('<article', '</article>') if isinstance(content, str) else (b'<article', b'</article>')
+        start = content.find(marker)
+        end = content.rfind(closing)
+        if start < 0 or end < start:
+            return None
+        return content[start:end + len(closing)]
+
+    def parse(self, content):
+        if not content:
+            return []
+        # Card layouts have no <article>; those still need the whole document
+        content = self.results_slice(content) or content
+        if isinstance(content, bytes):
+            root = lxml_html.fromstring(content, parser=self.html_parser)
+        else:
+            root = lxml_html.fromstring(content)
+        elements = self.articles(root) or self.cards(root)
+
+        listings = []
+        for element in elements:
+            start = time.perf_counter()
+            try:
+                href = self.link(element)
+                if not href:
+                    continue
+                heading = next((found[0] for found in (xpath(element) for xpath in self.titles) if found), None)
+                price = self.price(element)
+                listings.append(make_listing(
+                    str(href[0]),
+                    heading.text_content().strip() if heading is not None else None,
+                    str(price[0]).strip() if price else None,
+                    self.private(element)))
+            except Exception as e:
+                logger.warning("Error parsing listing: %s", e)
+                metrics.inc('immoweb_parse_errors_total', parser=self.name)
+            metrics.record('extract', time.perf_counter() - start)
+        return listings
+
+
+PARSERS = {'bs4': SoupParser}
+if lxml_html is not None:
+    PARSERS['lxml'] = LxmlParser
+
+_instances = {}
+_embedded = EmbeddedJsonParser()
+
+
+def get_parser(name=None):
+    """Return a parser backend; 'auto' picks the fastest installed one"""
+    name = name or Config.HTML_PARSER
+    if name == 'auto':
+        name = 'lxml' if 'lxml' in PARSERS else 'bs4'
+    if name not in PARSERS:
+        raise ValueError(f"Unknown or unavailable HTML parser: {name}")
+    if name not in _instances:
+        _instances[name] = PARSERS[name]()
+    return _instances[name]
+
+
+def parse_listings(content, parser=None, mode=None):
+    """Parse a search result page into listing dicts
+
+    In 'auto' mode the embedded JSON payload is used when present and the
+    HTML parser backend is only the fallback.
+    """
+    mode = mode or Config.EXTRACTION_MODE
+    if mode in ('auto', 'json'):
+        try:
+            listings = _embedded.parse(content)
+        except ValueError as e:
+            # Covers malformed JSON from both json and ijson
+            logger.warning("Error decoding embedded results: %s", e)
+            listings = None
+        if listings is not None or mode == 'json':
+            return listings or []
+    return get_parser(parser).parse(content)
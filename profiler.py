@@ -0,0 +1,118 @@
+"""Opt-in sampling profiler for check runs
+
+arm(n) profiles the next n check runs. While a run is profiled a daemon
+thread samples the stacks of the check threads (the one that started the
+run and the fetch group workers) every PROFILE_INTERVAL milliseconds and
+counts them in collapsed form ("thread;outer;inner count"), the input
+format of flamegraph.pl and speedscope. The stacks are stored per run in
+the profiles table. When nothing is armed begin() is an integer check.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import db
+import view_cache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Thread name prefix of the fetch group workers started by a check run
+WORKER_PREFIX = 'check-group'
+
+_lock = threading.Lock()
+_remaining = 0
+
+
+def arm(runs):
+    global _remaining
+    with _lock:
+        _remaining = max(0, int(runs))
+
+
+def remaining():
+    return _remaining
+
+
+def begin():
+    """Start a Sampler if a profiled run is armed, else return None"""
+    global _remaining
+    if not _remaining:
+        return None
+    with _lock:
+        if not _remaining:
+            return None
+        _remaining -= 1
+    # The settings page shows the remaining count
+    view_cache.invalidate()
+    sampler = Sampler(threading.get_ident(), Config.PROFILE_INTERVAL / 1000)
+    sampler.start()
+    return sampler
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """Counts collapsed stacks of the check threads until stop()"""
+
+    def __init__(self, target, interval):
+        super().__init__(name='profiler', daemon=True)
+        self.target = target
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        started = time.perf_counter()
+        while not self._done.wait(self.interval):
+            sampled = {thread.ident for thread in threading.enumerate()
+                       if thread.ident == self.target or thread.name.startswith(WORKER_PREFIX)}
+            for ident, frame in sys._current_frames().items():
+                if ident not in sampled:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append('check' if ident == self.target else WORKER_PREFIX)
+                self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+        self.seconds = time.perf_counter() - started
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def finish(sampler, new_count=None):
+    """Stop the sampler and store its stacks; returns the profile id"""
+    sampler.stop()
+    with db.transaction() as conn:
+        c = conn.execute("""INSERT INTO profiles (started_at, seconds, samples, interval_ms, new_count, stacks)
+                            VALUES (?, ?, ?, ?, ?, ?)""",
+                         (int(sampler.started_at), round(sampler.seconds, 3), sampler.samples,
+                          Config.PROFILE_INTERVAL, new_count, sampler.collapsed()))
+        conn.execute("DELETE FROM profiles WHERE id <= ?", (c.lastrowid - Config.PROFILE_KEEP,))
+    view_cache.invalidate()
+    logger.info("Stored profile %d: %d samples over %.1fs", c.lastrowid, sampler.samples, sampler.seconds)
+    return c.lastrowid
+
+
+def list_profiles():
+    return [dict(row) for row in db.query("""SELECT id, started_at, seconds, samples, interval_ms, new_count
+                                             FROM profiles ORDER BY id DESC""")]
+
+
+def get_profile(profile_id):
+    return db.query_one("SELECT * FROM profiles WHERE id = ?", (profile_id,))
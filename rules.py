@@ -0,0 +1,179 @@
+"""Notification rules compiled into bitsets
+
+Every active rule gets one bit. Each condition is precompiled into an index
+that returns, for one property, the mask of rules it passes: a dict lookup
+per search, seller type and title word, and a bisect over sorted bounds for
+the numeric thresholds. A property's matching rules are the AND of a handful
+of masks, so evaluating a batch costs the same whether there are three rules
+or three hundred.
+"""
+import bisect
+import re
+import threading
+
+import db
+
+WORD_RE = re.compile(r'\w+')
+SELLER_TYPES = {'private': 'Particulier', 'agency': 'Makelaar'}
+
+
+def split_list(value):
+    """Split a comma, semicolon or newline separated setting into its items"""
+    return [item.strip() for item in re.split(r'[,;\n]', value or '') if item.strip()]
+
+
+def normalise_phrase(value):
+    return ' '.join(WORD_RE.findall(value.casefold()))
+
+
+class _Bound:
+    """Rules with a lower (value >= bound) or upper (value <= bound) limit on one field"""
+
+    def __init__(self, bounds, all_mask, upper):
+        # bounds: (limit, bit) for rules that set this limit; other rules always pass
+        bounds = sorted(bounds)
+        self.upper = upper
+        self.limits = [limit for limit, _ in bounds]
+        self.unbounded = all_mask
+        for _, bit in bounds:
+            self.unbounded &= ~bit
+        # masks[i]: rules among the first i (lower) or from i onwards (upper) in sorted order
+        self.masks = [0] * (len(bounds) + 1)
+        if upper:
+            for i in range(len(bounds) - 1, -1, -1):
+                self.masks[i] = self.masks[i + 1] | bounds[i][1]
+        else:
+            for i, (_, bit) in enumerate(bounds, start=1):
+                self.masks[i] = self.masks[i - 1] | bit
+
+    def passing(self, value):
+        if value is None or not self.limits:
+            return self.unbounded
+        if self.upper:
+            return self.unbounded | self.masks[bisect.bisect_left(self.limits, value)]
+        return self.unbounded | self.masks[bisect.bisect_right(self.limits, value)]
+
+
+class RuleEngine:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.all = (1 << len(self.rules)) - 1
+        self.any_search = 0
+        self.by_search = {}
+        self.by_seller = {seller: 0 for seller in SELLER_TYPES.values()}
+        self.without_include = 0
+        self.include = {}
+        self.exclude = {}
+        self.max_words = 1
+        bounds = {'min_price': [], 'max_price': [], 'max_price_per_m2': [], 'min_bedrooms': []}
+
+        for position, rule in enumerate(self.rules):
+            bit = 1 << position
+            if rule.get('search_id'):
+                self.by_search[rule['search_id']] = self.by_search.get(rule['search_id'], 0) | bit
+            else:
+                self.any_search |= bit
+            seller = SELLER_TYPES.get(rule.get('seller_type'))
+            for name in self.by_seller:
+                if seller is None or seller == name:
+                    self.by_seller[name] |= bit
+            includes = [normalise_phrase(k) for k in split_list(rule.get('include_keywords'))]
+            includes = [k for k in includes if k]
+            if not includes:
+                self.without_include |= bit
+            for keyword in includes:
+                self.include[keyword] = self.include.get(keyword, 0) | bit
+            for keyword in split_list(rule.get('exclude_keywords')):
+                keyword = normalise_phrase(keyword)
+                if keyword:
+                    self.exclude[keyword] = self.exclude.get(keyword, 0) | bit
+            for field, limits in bounds.items():
+                if rule.get(field) is not None:
+                    limits.append((rule[field], bit))
+
+        for keyword in list(self.include) + list(self.exclude):
+            self.max_words = max(self.max_words, keyword.count(' ') + 1)
+        self.min_price = _Bound(bounds['min_price'], self.all, upper=False)
+        self.max_price = _Bound(bounds['max_price'], self.all, upper=True)
+        self.max_price_per_m2 = _Bound(bounds['max_price_per_m2'], self.all, upper=True)
+        self.min_bedrooms = _Bound(bounds['min_bedrooms'], self.all, upper=False)
+
+    def _phrases(self, prop):
+        words = WORD_RE.findall(f"{prop.get('title') or ''} {prop.get('location') or ''}".casefold())
+        for size in range(1, self.max_words + 1):
+            for i in range(len(words) - size + 1):
+                yield ' '.join(words[i:i + size])
+
+    def match(self, prop):
+        """Bit mask of the rules a property satisfies"""
+        if not self.rules:
+            return 0
+        mask = self.any_search | self.by_search.get(prop.get('search_id'), 0)
+        mask &= self.by_seller.get(prop.get('seller_type'), self.all)
+        price = prop.get('price_value')
+        mask &= self.min_price.passing(price) & self.max_price.passing(price)
+        surface = prop.get('surface')
+        mask &= self.max_price_per_m2.passing(price / surface if price and surface else None)
+        mask &= self.min_bedrooms.passing(prop.get('bedrooms'))
+        if not mask:
+            return 0
+        included = self.without_include
+        excluded = 0
+        if self.include or self.exclude:
+            for phrase in self._phrases(prop):
+                included |= self.include.get(phrase, 0)
+                excluded |= self.exclude.get(phrase, 0)
+        return mask & included & ~excluded
+
+    def matching_rules(self, prop):
+        mask = self.match(prop)
+        return [rule for position, rule in enumerate(self.rules) if mask >> position & 1]
+
+    def route(self, properties, default_recipients):
+        """
+        Map recipient -> properties for one batch
+
+        Without rules everything goes to the default recipients. With rules a
+        property goes to the recipients of every rule it matches, and rules
+        without recipients of their own use the defaults; the catch-all rule
+        created by the migrations keeps every property going to the defaults
+        until it is deleted.
+        """
+        default_recipients = list(default_recipients)
+        if not self.rules:
+            return {recipient: list(properties) for recipient in default_recipients} if properties else {}
+        recipients_by_rule = [split_list(rule.get('recipients')) or default_recipients for rule in self.rules]
+        routes = {}
+        for prop in properties:
+            mask = self.match(prop)
+            targets = set()
+            position = 0
+            while mask:
+                if mask & 1:
+                    targets.update(recipients_by_rule[position])
+                mask >>= 1
+                position += 1
+            for recipient in targets:
+                routes.setdefault(recipient, []).append(prop)
+        return routes
+
+
+_engine = None  # (rules_version, engine)
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Engine compiled from the active rules, rebuilt when any process changed them or after invalidate()"""
+    global _engine
+    version = db.counter('rules_version')
+    with _engine_lock:
+        if _engine is None or _engine[0] != version:
+            _engine = (version, RuleEngine(dict(row) for row in db.query(
+                "SELECT * FROM notification_rules WHERE active = 1 ORDER BY id")))
+        return _engine[1]
+
+
+def invalidate():
+    global _engine
+    with _engine_lock:
+        _engine = None
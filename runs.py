@@ -0,0 +1,167 @@
+"""Check run journal and the lease that keeps check runs from overlapping
+
+A run records which searches it still has to do in check_run_searches. If
+the process dies mid-cycle the run stays 'running'; the next process to take
+the lease finds it and resumes with the searches that are still pending.
+The lease lives in SQLite so it also holds across gunicorn workers.
+"""
+import os
+import socket
+import time
+import uuid
+
+import db
+from config import Config
+
+LOCK_NAME = 'property_check'
+
+
+def acquire_lease():
+    """Try to take the run lease; returns an owner token or None if it is held"""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    now = int(time.time())
+    with db.transaction(immediate=True) as conn:
+        conn.execute("INSERT OR IGNORE INTO run_locks (name, owner, expires_at) VALUES (?, NULL, 0)", (LOCK_NAME,))
+        c = conn.execute("""UPDATE run_locks SET owner = ?, expires_at = ?
+                            WHERE name = ? AND (owner IS NULL OR expires_at < ?)""",
+                         (owner, now + Config.RUN_LEASE_TTL, LOCK_NAME, now))
+        return owner if c.rowcount == 1 else None
+
+
+def renew_lease(owner):
+    db.execute("UPDATE run_locks SET expires_at = ? WHERE name = ? AND owner = ?",
+               (int(time.time()) + Config.RUN_LEASE_TTL, LOCK_NAME, owner))
+
+
+def release_lease(owner):
+    db.execute("UPDATE run_locks SET owner = NULL, expires_at = 0 WHERE name = ? AND owner = ?",
+               (LOCK_NAME, owner))
+
+
+def queue_run(mode):
+    """
+    Create a run in 'queued' state so callers get its id before it starts
+
+    Returns (run id, created). A run of this mode that is already queued (or
+    running under a live lease) is returned instead of queuing another one.
+    For queued runs started_at is the queue time.
+    """
+    with db.transaction(immediate=True) as conn:
+        expire_queued()
+        row = conn.execute("SELECT id FROM check_runs WHERE mode = ? AND status = 'queued' ORDER BY id LIMIT 1",
+                           (mode,)).fetchone()
+        if row is None and lease_active():
+            row = conn.execute("""SELECT id FROM check_runs WHERE mode = ? AND status = 'running'
+                                  ORDER BY id DESC LIMIT 1""", (mode,)).fetchone()
+        if row is not None:
+            return row['id'], False
+        return conn.execute("INSERT INTO check_runs (started_at, mode, status) VALUES (?, ?, 'queued')",
+                            (int(time.time()), mode)).lastrowid, True
+
+
+def expire_queued():
+    """Abandon queued runs that nothing picked up within RUN_LEASE_TTL, e.g. because their process restarted"""
+    now = int(time.time())
+    db.execute("""UPDATE check_runs SET status = 'abandoned', finished_at = ?
+                  WHERE status = 'queued' AND (started_at IS NULL OR started_at < ?)""",
+               (now, now - Config.RUN_LEASE_TTL))
+
+
+def lease_active():
+    """Whether some process currently holds an unexpired run lease"""
+    return db.query_one("SELECT 1 FROM run_locks WHERE name = ? AND owner IS NOT NULL AND expires_at >= ?",
+                        (LOCK_NAME, int(time.time()))) is not None
+
+
+def start_run(mode, search_ids, run_id=None):
+    with db.transaction() as conn:
+        if run_id is None:
+            run_id = conn.execute("INSERT INTO check_runs (started_at, mode, status) VALUES (?, ?, 'running')",
+                                  (int(time.time()), mode)).lastrowid
+        else:
+            conn.execute("UPDATE check_runs SET started_at = ?, mode = ?, status = 'running' WHERE id = ?",
+                         (int(time.time()), mode, run_id))
+        conn.executemany("INSERT INTO check_run_searches (run_id, search_id, status) VALUES (?, ?, 'pending')",
+                         [(run_id, search_id) for search_id in search_ids])
+    return run_id
+
+
+def interrupted_run():
+    """
+    Return (run id, started_at) of a run that never finished, or None
+
+    Only call this while holding the lease: any run still marked 'running'
+    then belongs to a process that died. Older leftovers are marked abandoned,
+    as are queued runs that were never picked up.
+    """
+    with db.transaction(immediate=True) as conn:
+        expire_queued()
+        rows = conn.execute("SELECT id, started_at FROM check_runs WHERE status = 'running' "
+                            "ORDER BY id DESC").fetchall()
+        if not rows:
+            return None
+        conn.executemany("UPDATE check_runs SET status = 'abandoned', finished_at = ? WHERE id = ?",
+                         [(int(time.time()), row['id']) for row in rows[1:]])
+        conn.execute("UPDATE check_runs SET resumed = resumed + 1 WHERE id = ?", (rows[0]['id'],))
+        return rows[0]['id'], rows[0]['started_at']
+
+
+def pending_searches(run_id):
+    return db.query("""SELECT s.* FROM search_configs s
+                       JOIN check_run_searches r ON r.search_id = s.id
+                       WHERE r.run_id = ? AND r.status = 'pending' AND s.active = 1""", (run_id,))
+
+
+def mark_searches_done(run_id, counts, started_at, finished_at):
+    """Record a finished fetch group; counts maps search id -> new properties"""
+    with db.transaction() as conn:
+        conn.executemany("""UPDATE check_run_searches
+                            SET status = 'done', new_count = ?, started_at = ?, finished_at = ?
+                            WHERE run_id = ? AND search_id = ?""",
+                         [(count, started_at, finished_at, run_id, search_id)
+                          for search_id, count in counts.items()])
+
+
+FINAL_STATUSES = ('completed', 'failed', 'skipped', 'abandoned')
+
+
+def finish_run(run_id, new_count, status='completed'):
+    """Close a run and delete finished runs older than RUN_KEEP_DAYS; their searches go by cascade"""
+    now = int(time.time())
+    with db.transaction() as conn:
+        conn.execute("UPDATE check_runs SET status = ?, finished_at = ?, new_count = ? WHERE id = ?",
+                     (status, now, new_count, run_id))
+        conn.execute(f"""DELETE FROM check_runs WHERE status IN ({','.join('?' * len(FINAL_STATUSES))})
+                         AND finished_at < ?""", FINAL_STATUSES + (now - Config.RUN_KEEP_DAYS * 86400,))
+
+
+def run_status(run_id):
+    """Progress of a run as a JSON-ready dict, or None if it does not exist"""
+    run = db.query_one("SELECT * FROM check_runs WHERE id = ?", (run_id,))
+    if run is None:
+        return None
+    searches = []
+    for row in db.query("""SELECT r.search_id, s.name, r.status, r.new_count, r.started_at, r.finished_at
+                           FROM check_run_searches r LEFT JOIN search_configs s ON s.id = r.search_id
+                           WHERE r.run_id = ? ORDER BY r.search_id""", (run_id,)):
+        searches.append({
+            'search_id': row['search_id'],
+            'name': row['name'],
+            'status': row['status'],
+            'new_count': row['new_count'],
+            'seconds': round(row['finished_at'] - row['started_at'], 3) if row['finished_at'] else None,
+        })
+    done = sum(1 for search in searches if search['status'] == 'done')
+    return {
+        'id': run['id'],
+        'mode': run['mode'],
+        'status': run['status'],
+        'started_at': run['started_at'],
+        'finished_at': run['finished_at'],
+        'resumed': run['resumed'],
+        'total_searches': len(searches),
+        'done_searches': done,
+        'new_count': run['new_count'] if run['new_count'] is not None
+        else sum(search['new_count'] or 0 for search in searches),
+        'searches': searches,
+    }
@@ -0,0 +1,47 @@
+"""Adaptive polling intervals for saved searches
+
+Each search keeps a smoothed estimate of how many new listings it yields per
+hour. The total polling budget stays what the global check interval would
+cost (every search once per interval), but it is redistributed in proportion
+to the square root of each search's velocity, which minimises the average
+delay between a listing appearing and us seeing it. Intervals are clamped
+to [MIN_POLL_INTERVAL, MAX_POLL_INTERVAL].
+"""
+import math
+
+from config import Config
+
+# Velocity assumed for searches that have never produced a listing, so they still get polled
+VELOCITY_FLOOR = 0.01
+
+
+def update_velocity(velocity, new_count, elapsed_seconds, smoothing=None):
+    """Exponentially smoothed new listings per hour"""
+    smoothing = Config.VELOCITY_SMOOTHING if smoothing is None else smoothing
+    if elapsed_seconds <= 0:
+        return velocity or 0.0
+    observed = new_count / (elapsed_seconds / 3600)
+    if velocity is None:
+        return observed
+    return smoothing * observed + (1 - smoothing) * velocity
+
+
+def allocate_intervals(velocities, base_interval, min_interval=None, max_interval=None):
+    """
+    Map search id -> velocity to search id -> poll interval in minutes
+
+    The polls per minute summed over all searches equal
+    len(velocities) / base_interval before clamping.
+    """
+    min_interval = Config.MIN_POLL_INTERVAL if min_interval is None else min_interval
+    max_interval = Config.MAX_POLL_INTERVAL if max_interval is None else max_interval
+    if not velocities:
+        return {}
+    weights = {sid: math.sqrt(max(v or 0.0, VELOCITY_FLOOR)) for sid, v in velocities.items()}
+    budget = len(velocities) / base_interval
+    total = sum(weights.values())
+    intervals = {}
+    for sid, weight in weights.items():
+        interval = 1 / (budget * weight / total)
+        intervals[sid] = max(min_interval, min(max_interval, interval))
+    return intervals
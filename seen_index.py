@@ -0,0 +1,141 @@
+import math
+import sys
+import threading
+
+DIGEST_SIZE = 16
+
+
+class BloomFilter:
+    """Bloom filter over 128-bit digests using double hashing"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def estimated_error_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class SeenIndex:
+    """In-memory set of known property IDs
+
+    A Bloom filter rejects unseen IDs without further work; possible hits are
+    confirmed against a sorted array of 16-byte MD5 digests (plus a small
+    unsorted buffer of recent inserts that is merged in periodically).
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.lock = threading.Lock()
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.digests = bytearray()
+        self.pending = set()
+        self.lookups = 0
+        self.bloom_rejects = 0
+        self.false_positives = 0
+
+    def __len__(self):
+        return len(self.digests) // DIGEST_SIZE + len(self.pending)
+
+    def _search(self, digest):
+        buf = self.digests
+        lo, hi = 0, len(buf) // DIGEST_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = bytes(buf[mid * DIGEST_SIZE:(mid + 1) * DIGEST_SIZE])
+            if value < digest:
+                lo = mid + 1
+            elif value > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def _merge(self):
+        buf = self.digests
+        merged = {bytes(buf[i:i + DIGEST_SIZE]) for i in range(0, len(buf), DIGEST_SIZE)}
+        merged.update(self.pending)
+        self.digests = bytearray(b''.join(sorted(merged)))
+        self.pending = set()
+
+    def _rebuild_bloom(self, capacity):
+        self._merge()
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        buf = self.digests
+        for i in range(0, len(buf), DIGEST_SIZE):
+            self.bloom.add(bytes(buf[i:i + DIGEST_SIZE]))
+
+    def add_many(self, property_ids):
+        with self.lock:
+            for property_id in property_ids:
+                digest = bytes.fromhex(property_id)
+                if digest in self.bloom and (digest in self.pending or self._search(digest)):
+                    continue
+                self.bloom.add(digest)
+                self.pending.add(digest)
+            if len(self) > self.bloom.capacity:
+                # Keep the false-positive rate near its target as history grows
+                self._rebuild_bloom(max(self.bloom.capacity, len(self)) * 2)
+            elif len(self.pending) > max(1024, len(self.digests) // DIGEST_SIZE // 16):
+                self._merge()
+
+    def add(self, property_id):
+        self.add_many([property_id])
+
+    def __contains__(self, property_id):
+        digest = bytes.fromhex(property_id)
+        with self.lock:
+            self.lookups += 1
+            if digest not in self.bloom:
+                self.bloom_rejects += 1
+                return False
+            if digest in self.pending or self._search(digest):
+                return True
+            self.false_positives += 1
+            return False
+
+    def load(self, conn):
+        """Warm start from the properties table"""
+        c = conn.execute("SELECT id FROM properties")
+        while True:
+            rows = c.fetchmany(10000)
+            if not rows:
+                break
+            with self.lock:
+                self.pending.update(bytes.fromhex(row[0]) for row in rows)
+        with self.lock:
+            self._rebuild_bloom(max(self.bloom.capacity, len(self) * 2))
+
+    def stats(self):
+        with self.lock:
+            negatives = self.bloom_rejects + self.false_positives
+            return {
+                'entries': len(self),
+                'bloom_bytes': len(self.bloom.bits),
+                'digest_bytes': len(self.digests) + len(self.pending) * (DIGEST_SIZE + sys.getsizeof(b'')),
+                'bloom_hashes': self.bloom.hashes,
+                'bloom_capacity': self.bloom.capacity,
+                'estimated_error_rate': self.bloom.estimated_error_rate(),
+                'lookups': self.lookups,
+                'bloom_rejects': self.bloom_rejects,
+                'false_positives': self.false_positives,
+                'observed_error_rate': self.false_positives / negatives if negatives else 0.0,
+            }
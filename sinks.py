@@ -0,0 +1,105 @@
+"""Notification sinks: where a batch of new properties gets delivered
+
+A sink has a unique name (its outbox channel), a timeout and a send(properties)
+method that returns True when delivered, False when the sink is switched off
+and raises on failure. Every sink gets its own outbox rows and worker thread,
+so a slow endpoint only delays its own deliveries.
+"""
+import requests
+
+from config import Config
+from notifications import digest_subject
+from parsers import format_price
+
+PAYLOAD_FIELDS = ['id', 'event', 'url', 'title', 'price', 'price_value', 'price_delta', 'location', 'seller_type',
+                  'first_seen', 'postal_code', 'bedrooms', 'surface']
+
+
+def summary_lines(properties):
+    lines = []
+    for prop in properties:
+        prefix = f"📉 {format_price(prop['previous_price_value'])} → " if prop.get('event') == 'price_drop' else ''
+        lines.append(f"{prefix}{prop['title']} - {prop['price']} - {prop['location'] or '-'} ({prop['seller_type']})\n{prop['url']}")
+    return lines
+
+
+class EmailSink:
+    """Wraps the SMTP digest sender; route() splits the outbox rows per recipient first"""
+
+    name = 'email'
+
+    def __init__(self, send, route, timeout=None, on_idle=None):
+        self._send = send
+        self._route = route
+        self.timeout = timeout or Config.SMTP_TIMEOUT
+        self.on_idle = on_idle
+
+    def route(self, properties):
+        return self._route(properties)
+
+    def send(self, properties):
+        return self._send(properties)
+
+
+class WebhookSink:
+    """POSTs the batch as JSON, or as a Slack-style {"text": ...} message"""
+
+    name = 'webhook'
+
+    def __init__(self, url, style='json', timeout=None):
+        self.url = url
+        self.style = style
+        self.timeout = timeout or Config.SINK_TIMEOUT
+        self.on_idle = None
+        # Only this sink's worker thread uses it
+        self.session = requests.Session()
+
+    def payload(self, properties):
+        if self.style == 'slack':
+            lines = summary_lines(properties)
+            return {'text': f"{digest_subject(properties)}\n\n" + '\n\n'.join(lines)}
+        return {'count': len(properties),
+                'properties': [{field: prop.get(field) for field in PAYLOAD_FIELDS} for prop in properties]}
+
+    def send(self, properties):
+        response = self.session.post(self.url, json=self.payload(properties), timeout=self.timeout)
+        response.raise_for_status()
+        return True
+
+
+class NtfySink:
+    """Push notification through an ntfy topic URL (https://ntfy.sh/<topic> or self-hosted)"""
+
+    name = 'ntfy'
+
+    def __init__(self, url, token=None, timeout=None):
+        self.url = url
+        self.token = token
+        self.timeout = timeout or Config.SINK_TIMEOUT
+        self.on_idle = None
+        # Only this sink's worker thread uses it
+        self.session = requests.Session()
+
+    def send(self, properties):
+        drops = sum(1 for prop in properties if prop.get('event') == 'price_drop')
+        headers = {'Title': f"{len(properties) - drops} nieuwe panden, {drops} prijsdalingen" if drops
+                   else f"{len(properties)} nieuwe panden gevonden", 'Tags': 'house'}
+        if len(properties) == 1:
+            headers['Click'] = properties[0]['url']
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        # ntfy reads header values as latin-1; the title above is plain ASCII on purpose
+        response = self.session.post(self.url, data='\n\n'.join(summary_lines(properties)).encode('utf-8'),
+                                     headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return True
+
+
+def configured_sinks(send_email, route_email, on_email_idle=None):
+    """Email is always present (it checks its own settings); the others are enabled by their URL"""
+    sinks = [EmailSink(send_email, route_email, on_idle=on_email_idle)]
+    if Config.WEBHOOK_URL:
+        sinks.append(WebhookSink(Config.WEBHOOK_URL, Config.WEBHOOK_STYLE))
+    if Config.NTFY_URL:
+        sinks.append(NtfySink(Config.NTFY_URL, Config.NTFY_TOKEN or None))
+    return sinks
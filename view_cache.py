@@ -0,0 +1,78 @@
+"""Rendered pages and dashboard stats, kept until the data behind them changes
+
+Writers call invalidate() after they commit (the scraper, the notification
+workers, the settings and search forms); that drops every cached page and
+value at once. Until then a cached page is served from memory with an ETag,
+and a browser that revalidates gets a 304. Other processes writing to the
+same database are not seen, so entries also expire after PAGE_CACHE_TTL;
+expired pages are evicted whenever a new page is stored, so one-off query
+strings do not pile up between writes.
+"""
+import functools
+import hashlib
+import threading
+import time
+
+from flask import Response, request
+
+import metrics
+from config import Config
+
+_lock = threading.Lock()
+_generation = 0
+_pages = {}
+_values = {}
+
+
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+        _pages.clear()
+        _values.clear()
+
+
+def _fresh(entry):
+    return entry is not None and time.monotonic() - entry[0] < Config.PAGE_CACHE_TTL
+
+
+def value(name, build):
+    """Cached result of build() until the next invalidate()"""
+    with _lock:
+        entry = _values.get(name)
+        generation = _generation
+    if _fresh(entry):
+        return entry[1]
+    result = build()
+    with _lock:
+        # Skip the store if a writer invalidated while we were building
+        if generation == _generation:
+            _values[name] = (time.monotonic(), result)
+    return result
+
+
+def page(view):
+    """Cache a view's HTML per URL and answer If-None-Match with 304"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        with _lock:
+            entry = _pages.get(key)
+            generation = _generation
+        if _fresh(entry):
+            metrics.inc('immoweb_page_cache_total', result='hit')
+        else:
+            metrics.inc('immoweb_page_cache_total', result='miss')
+            body = view(*args, **kwargs)
+            entry = (time.monotonic(), body, hashlib.blake2b(body.encode(), digest_size=12).hexdigest())
+            with _lock:
+                if generation == _generation:
+                    for stale in [stale for stale, cached in _pages.items() if not _fresh(cached)]:
+                        del _pages[stale]
+                    _pages[key] = entry
+        response = Response(entry[1], mimetype='text/html')
+        response.set_etag(entry[2])
+        # Browsers revalidate every time; unchanged pages cost a 304 without a body
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    return wrapper